@@ -1,14 +1,23 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, current_app, \
+    Response, stream_with_context, abort
 from flask_login import login_required, current_user
-from database_models.models import Student, Attendance, promote_students, User
+from database_models.models import Student, Attendance, AttendanceSummary, promote_students, User, forget_attendance
 from database_models.extensions import db
-from sqlalchemy import or_, text
-import pandas as pd
+from database_models.cache import get_cache
+from database_models.rosters import admin_counts, invalidate_students, invalidate_attendance
+from qr_face.enrollment import schedule, schedule_enrollment, rebuild_level_index, enroll_students
+from qr_face.pictures import store_picture
+from database_models.exports import XLSX_MIMETYPE, CSV_MIMETYPE, NDJSON_MIMETYPE, format_datetime, stream_rows, \
+    write_xlsx, csv_chunks, ndjson_chunks
+from database_models.student_import import StudentImport, read_rows, IMPORT_FIELDS
+from sqlalchemy import or_, text, tuple_
+from datetime import datetime, timedelta
+import base64
+import json
 from io import BytesIO
 from reportlab.pdfgen import canvas
 from functools import wraps
-import os
-from werkzeug.utils import secure_filename
+import zipfile
 
 # Use a unique blueprint name to avoid conflicts
 admin = Blueprint('admin_panel', __name__, url_prefix='/admin')
@@ -25,17 +34,40 @@ def admin_required(f):
     return decorated
 
 
+def filter_attendance(query, args):
+    """Apply the attendance page filters (matricule, level, course, date range) to ``query``.
+
+    ``date_from`` and ``date_to`` are inclusive ``YYYY-MM-DD`` dates. Raises
+    ValueError if a level or date cannot be parsed.
+    """
+    matricule_filter = args.get('matricule', '').strip()
+    level_filter = args.get('level', '').strip()
+    course_filter = args.get('course', '').strip()
+    date_from = args.get('date_from', '').strip()
+    date_to = args.get('date_to', '').strip()
+
+    if matricule_filter:
+        query = query.filter(Student.matricule.contains(matricule_filter))
+    if level_filter:
+        query = query.filter(Student.level == int(level_filter))
+    if course_filter:
+        query = query.filter(Attendance.course.contains(course_filter))
+    if date_from:
+        query = query.filter(Attendance.date_time >= datetime.strptime(date_from, "%Y-%m-%d"))
+    if date_to:
+        query = query.filter(Attendance.date_time < datetime.strptime(date_to, "%Y-%m-%d") + timedelta(days=1))
+    return query
+
+
 @admin.route('/')
 @login_required
 @admin_required
 def admin_dashboard():
-    total_students = Student.query.count()
-    total_attendance = Attendance.query.count()
-    delegates = Student.query.filter_by(role='delegate').count()
+    counts = admin_counts()
     return render_template('admin_dashboard.html',
-                           total_students=total_students,
-                           total_attendance=total_attendance,
-                           delegates=delegates)
+                           total_students=counts['total_students'],
+                           total_attendance=counts['total_attendance'],
+                           delegates=counts['delegates'])
 
 
 @admin.route('/profile', methods=['GET', 'POST'])
@@ -107,36 +139,75 @@ def add_student():
         specialty = request.form['specialty'].strip()
         role = request.form.get('role', 'student')
 
-        # Handle picture upload
-        picture = request.files['picture']
-        picture_path = None
-        if picture and picture.filename != '':
-            filename = secure_filename(picture.filename)
-            picture_path = os.path.join('uploads', filename)
-            picture.save(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
-
         if Student.query.get(matricule):
             flash(f"Student with matricule {matricule} already exists.", "danger")
             return redirect(url_for('admin_panel.add_student'))
 
+        # Handle picture upload (stored under its content hash)
+        picture = request.files['picture']
+        picture_path = None
+        if picture and picture.filename != '':
+            try:
+                picture_path = store_picture(picture.stream)
+            except ValueError as e:
+                flash(str(e), "danger")
+                return redirect(url_for('admin_panel.add_student'))
+
         new_student = Student(
             matricule=matricule, name=name, level=level, email=email,
             phone=phone, specialty=specialty, role=role, picture=picture_path
         )
         db.session.add(new_student)
         db.session.commit()
+        invalidate_students()
+        if picture_path:
+            # Thumbnails and the face encoding are computed off the request thread
+            schedule_enrollment(matricule)
         flash(f"Student {name} added successfully.", "success")
         return redirect(url_for('admin_panel.admin_students'))
 
     return render_template('add_student.html')
 
 
+@admin.route('/students/import', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def import_students():
+    if request.method == 'POST':
+        roster = request.files.get('roster')
+        if not roster or roster.filename == '':
+            flash("Please choose a .csv or .xlsx file.", "danger")
+            return redirect(url_for('admin_panel.import_students'))
+
+        photos = request.files.get('photos')
+        try:
+            archive = zipfile.ZipFile(photos.stream) if photos and photos.filename else None
+            rows = read_rows(roster.stream, roster.filename)
+        except (ValueError, zipfile.BadZipFile) as e:
+            flash(str(e), "danger")
+            return redirect(url_for('admin_panel.import_students'))
+
+        result = StudentImport(photos=archive).run(rows)
+        invalidate_students()
+        # Encodings for the imported photos are computed off the request thread
+        with_pictures = [matricule for matricule, picture in result.imported if picture]
+        if with_pictures:
+            schedule(enroll_students, with_pictures)
+
+        category = "success" if not result.error_count else "warning"
+        flash(f"{len(result.imported)} student(s) imported, {result.error_count} row(s) with errors.", category)
+        return render_template('import_students.html', report=result.report(), fields=IMPORT_FIELDS)
+
+    return render_template('import_students.html', report=None, fields=IMPORT_FIELDS)
+
+
 @admin.route('/student/edit/<matricule>', methods=['GET', 'POST'])
 @login_required
 @admin_required
 def edit_student(matricule):
     student = Student.query.get_or_404(matricule)
     if request.method == 'POST':
+        old_level = student.level
         student.name = request.form['name'].strip()
         student.level = int(request.form['level'])
         student.email = request.form['email'].strip()
@@ -144,13 +215,15 @@ def edit_student(matricule):
         student.specialty = request.form['specialty'].strip()
         student.role = request.form['role']
 
-        # Handle picture upload
+        # Handle picture upload (stored under its content hash)
         picture = request.files['picture']
         if picture and picture.filename != '':
-            filename = secure_filename(picture.filename)
-            picture_path = os.path.join('uploads', filename)
-            picture.save(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
-            student.picture = picture_path
+            try:
+                student.picture = store_picture(picture.stream)
+            except ValueError as e:
+                db.session.rollback()
+                flash(str(e), "danger")
+                return redirect(url_for('admin_panel.edit_student', matricule=matricule))
 
         # Update user role if exists
         user = User.query.filter_by(matricule=matricule).first()
@@ -158,6 +231,15 @@ def edit_student(matricule):
             user.role = student.role
 
         db.session.commit()
+        invalidate_students()
+
+        # Re-encode only if the picture content changed; move the encoding
+        # to the new level's index if the level changed
+        if student.picture:
+            schedule_enrollment(matricule)
+        if old_level != student.level:
+            schedule(rebuild_level_index, old_level)
+            schedule(rebuild_level_index, student.level)
         flash("Student updated successfully.", "success")
         return redirect(url_for('admin_panel.admin_students'))
 
@@ -177,6 +259,7 @@ def assign_delegate(matricule):
         user.role = 'delegate'
 
     db.session.commit()
+    invalidate_students()
     flash(f"{student.name} is now a delegate.", "success")
     return redirect(url_for('admin_panel.admin_students'))
 
@@ -187,8 +270,11 @@ def assign_delegate(matricule):
 def delete_student(matricule):
     student = Student.query.get_or_404(matricule)
     Attendance.query.filter_by(student_matricule=matricule).delete(synchronize_session=False)
+    AttendanceSummary.query.filter_by(student_matricule=matricule).delete(synchronize_session=False)
     db.session.delete(student)
     db.session.commit()
+    invalidate_students()
+    invalidate_attendance()
     flash(f"Deleted student {student.name} and their attendance.", "success")
     return redirect(url_for('admin_panel.admin_students'))
 
@@ -197,19 +283,65 @@ def delete_student(matricule):
 @login_required
 @admin_required
 def promote_students_route():
-    promote_students()
-    flash("All students promoted successfully.", "success")
+    counts = promote_students()
+    invalidate_students()
+    # Every promoted student moved index: rebuild the levels they left and joined
+    for level in sorted(set(counts) | {level + 1 for level in counts}):
+        schedule(rebuild_level_index, level)
+    flash(f"All students promoted successfully ({sum(counts.values())} student(s)).", "success")
     return redirect(url_for('admin_panel.admin_dashboard'))
 
 
+# Columns the attendance page can be sorted by; ties are broken by Attendance.id
+ATTENDANCE_SORT_COLUMNS = {
+    'date': Attendance.date_time,
+    'matricule': Attendance.student_matricule,
+    'course': Attendance.course,
+    'status': Attendance.final_status,
+    'name': Student.name,
+    'level': Student.level,
+}
+
+# Filtered row counts are expensive on big tables, so they are cached briefly
+# and shown as an approximate total
+COUNT_CACHE_TTL = 60
+
+
+def encode_cursor(value, row_id):
+    if isinstance(value, datetime):
+        value = {'dt': value.isoformat()}
+    return base64.urlsafe_b64encode(json.dumps([value, row_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if isinstance(value, dict):
+        value = datetime.fromisoformat(value['dt'])
+    return value, int(row_id)
+
+
+def approximate_count(query, key):
+    return get_cache().get_or_set('attendance_count', repr(key), lambda: query.order_by(None).count(),
+                                  ttl=COUNT_CACHE_TTL)
+
+
+def _page_url(**changes):
+    args = request.args.to_dict()
+    args.update(changes)
+    return url_for('admin_panel.view_attendance', **{k: v for k, v in args.items() if v is not None})
+
+
 @admin.route('/attendance')
 @login_required
 @admin_required
 def view_attendance():
-    # Get filter parameters
-    matricule_filter = request.args.get('matricule', '').strip()
-    level_filter = request.args.get('level', '').strip()
-    course_filter = request.args.get('course', '').strip()
+    sort = request.args.get('sort', 'date')
+    order = request.args.get('order', 'desc')
+    if sort not in ATTENDANCE_SORT_COLUMNS or order not in ('asc', 'desc'):
+        sort, order = 'date', 'desc'
+    page_size = min(request.args.get('per_page', current_app.config.get('ATTENDANCE_PAGE_SIZE', 50), type=int),
+                    current_app.config.get('ATTENDANCE_MAX_PAGE_SIZE', 500))
+    page_size = max(page_size, 1)
 
     # Build query
     query = db.session.query(Attendance, Student).join(
@@ -217,16 +349,58 @@ def view_attendance():
     )
 
     # Apply filters
-    if matricule_filter:
-        query = query.filter(Student.matricule.contains(matricule_filter))
-    if level_filter:
-        query = query.filter(Student.level == int(level_filter))
-    if course_filter:
-        query = query.filter(Attendance.course.contains(course_filter))
-
-    results = query.all()
-
-    return render_template('admin_attendance.html', results=results)
+    try:
+        query = filter_attendance(query, request.args)
+        after = request.args.get('after')
+        before = request.args.get('before')
+        cursor = decode_cursor(after or before) if (after or before) else None
+    except (ValueError, TypeError):
+        flash('Invalid filter value.', 'danger')
+        return redirect(url_for('admin_panel.view_attendance'))
+
+    filter_key = tuple(sorted((k, v) for k, v in request.args.items()
+                              if k not in ('sort', 'order', 'per_page', 'after', 'before')))
+    total = approximate_count(query, filter_key)
+
+    # Keyset (seek) pagination on (sort column, id): each page starts right
+    # after the previous page's last row, so page N costs the same as page 1
+    column = ATTENDANCE_SORT_COLUMNS[sort]
+    descending = order == 'desc'
+    backwards = before is not None and after is None
+    if cursor:
+        key = tuple_(column, Attendance.id)
+        bound = tuple_(*cursor)
+        query = query.filter(key < bound if descending != backwards else key > bound)
+    if descending != backwards:
+        query = query.order_by(column.desc(), Attendance.id.desc())
+    else:
+        query = query.order_by(column.asc(), Attendance.id.asc())
+
+    results = query.limit(page_size + 1).all()
+    has_more = len(results) > page_size
+    results = results[:page_size]
+    if backwards:
+        results.reverse()
+
+    next_url = prev_url = None
+    if results:
+        first_att, first_stu = results[0]
+        last_att, last_stu = results[-1]
+        def sort_value(att, stu):
+            return getattr(stu if column.class_ is Student else att, column.key)
+
+        if has_more or backwards:
+            next_url = _page_url(after=encode_cursor(sort_value(last_att, last_stu), last_att.id), before=None)
+        if cursor and (has_more or not backwards):
+            prev_url = _page_url(before=encode_cursor(sort_value(first_att, first_stu), first_att.id), after=None)
+
+    sort_urls = {name: _page_url(sort=name, order='asc' if name == sort and descending else 'desc',
+                                 after=None, before=None)
+                 for name in ATTENDANCE_SORT_COLUMNS}
+
+    return render_template('admin_attendance.html', results=results, total=total,
+                           next_url=next_url, prev_url=prev_url, sort_urls=sort_urls,
+                           sort=sort, order=order)
 
 
 @admin.route('/attendance/delete/<int:attendance_id>', methods=['POST'])
@@ -234,8 +408,10 @@ def view_attendance():
 @admin_required
 def delete_attendance(attendance_id):
     att = Attendance.query.get_or_404(attendance_id)
+    forget_attendance(Attendance.id == att.id)
     db.session.delete(att)
     db.session.commit()
+    invalidate_attendance()
     flash("Attendance record deleted.", "success")
     return redirect(url_for('admin_panel.view_attendance'))
 
@@ -259,9 +435,11 @@ def delete_selected_attendance():
         flash('Invalid attendance IDs provided.', 'danger')
         return redirect(redirect_url)
 
-    # Delete selected records
+    # Delete selected records (and take them out of the attendance summary)
+    forget_attendance(Attendance.id.in_(attendance_ids))
     deleted_count = Attendance.query.filter(Attendance.id.in_(attendance_ids)).delete(synchronize_session=False)
     db.session.commit()
+    invalidate_attendance()
 
     flash(f'Successfully deleted {deleted_count} attendance record(s).', 'success')
     return redirect(redirect_url)
@@ -271,29 +449,67 @@ def delete_selected_attendance():
 @login_required
 @admin_required
 def export_excel():
-    results = db.session.query(Attendance, Student).join(
-        Student, Attendance.student_matricule == Student.matricule
-    ).all()
-
-    data = [{
-        "Matricule": att.student_matricule,
-        "Name": stu.name or "",
-        "Level": stu.level or "",
-        "Course": att.course,
-        "Date": att.date_time.strftime("%Y-%m-%d %H:%M") if att.date_time else "",
-        "Status": att.final_status or "",
-        "Lecture": att.lecture_description or ""
-    } for att, stu in results]
-
-    df = pd.DataFrame(data)
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False)
-
-    output.seek(0)
+    query = db.session.query(
+        Attendance.student_matricule, Student.name, Student.level, Attendance.course,
+        Attendance.date_time, Attendance.final_status, Attendance.lecture_description
+    ).join(Student, Attendance.student_matricule == Student.matricule)
+
+    rows = ([
+        matricule,
+        name or "",
+        level or "",
+        course,
+        format_datetime(date_time),
+        status or "",
+        lecture or ""
+    ] for matricule, name, level, course, date_time, status, lecture in stream_rows(query))
+
+    output = write_xlsx(["Matricule", "Name", "Level", "Course", "Date", "Status", "Lecture"], rows)
     return send_file(
         output, as_attachment=True, download_name="attendance.xlsx",
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        mimetype=XLSX_MIMETYPE
+    )
+
+
+EXPORT_FIELDS = ["matricule", "name", "level", "course", "date", "status", "lecture"]
+
+
+def _export_rows():
+    """Stream the filtered attendance rows for the CSV/NDJSON exports."""
+    query = db.session.query(
+        Attendance.student_matricule, Student.name, Student.level, Attendance.course,
+        Attendance.date_time, Attendance.final_status, Attendance.lecture_description
+    ).join(Student, Attendance.student_matricule == Student.matricule)
+
+    try:
+        query = filter_attendance(query, request.args)
+    except ValueError:
+        abort(400)
+
+    return ((
+        matricule, name or "", level, course, format_datetime(date_time), status or "", lecture or ""
+    ) for matricule, name, level, course, date_time, status, lecture in stream_rows(query.order_by(Attendance.id)))
+
+
+@admin.route('/attendance/export.csv')
+@login_required
+@admin_required
+def export_csv():
+    rows = _export_rows()
+    return Response(
+        stream_with_context(csv_chunks(EXPORT_FIELDS, rows)), mimetype=CSV_MIMETYPE,
+        headers={"Content-Disposition": "attachment; filename=attendance.csv"}
+    )
+
+
+@admin.route('/attendance/export.ndjson')
+@login_required
+@admin_required
+def export_ndjson():
+    rows = _export_rows()
+    return Response(
+        stream_with_context(ndjson_chunks(EXPORT_FIELDS, rows)), mimetype=NDJSON_MIMETYPE,
+        headers={"Content-Disposition": "attachment; filename=attendance.ndjson"}
     )
 
 
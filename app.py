@@ -9,12 +9,15 @@ from flask_login import current_user
 from database_models.models import User, Student, Attendance
 from database_models.config import Config
 from database_models.extensions import db, migrate, login_manager
+from database_models.migrations import upgrade_schema
 from auth_security.auth import auth as auth_blueprint
 from admin_panel.admin import admin as admin_blueprint
 from dashboards.delegate import delegate as delegate_blueprint
 from dashboards.student import student as student_blueprint
 from qr_face.qr_face import qr_face as qr_face_blueprint
 from main import main as main_blueprint
+from commands import register_commands
+from metrics import init_metrics
 from werkzeug.security import generate_password_hash
 import os
 
@@ -37,9 +40,16 @@ app.register_blueprint(student_blueprint)
 app.register_blueprint(qr_face_blueprint)
 app.register_blueprint(main_blueprint)
 
+# Register CLI commands
+register_commands(app)
+
+# Per-request latency / SQL statement metrics, served on /metrics
+init_metrics(app)
+
 # Create tables and default admin user
 with app.app_context():
     db.create_all()
+    upgrade_schema()
 
     # Check if admin user exists, if not create one
     admin_user = User.query.filter_by(role='admin').first()
@@ -1,15 +1,34 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash, session
+from flask import Blueprint, render_template, redirect, url_for, request, flash, session, make_response
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.exceptions import ServiceUnavailable
+from auth_security.passwords import HashingBusy, needs_rehash
+from auth_security.rate_limit import rate_limited, login_identity
 from database_models.models import User, Student
 from database_models.extensions import db
+from database_models.rosters import invalidate_students
+from dashboards.live_session import SESSION_KEY, get_current_session
+from dashboards.finalize import finalize_session
 import random
 import string
 
 auth = Blueprint('auth', __name__)
 
 
+@auth.app_errorhandler(HashingBusy)
+def hashing_busy(error):
+    # Shed the login burst instead of queueing it behind every other request;
+    # password checks elsewhere (e.g. the admin profile) get a plain 503
+    if request.endpoint != 'auth.login':
+        return ServiceUnavailable(retry_after=2).get_response()
+    flash('Too many sign-ins right now, please try again in a few seconds.', 'warning')
+    response = make_response(render_template('login.html'), 503)
+    response.headers['Retry-After'] = '2'
+    return response
+
+
 @auth.route('/login', methods=['GET', 'POST'])
+@rate_limited(identity=login_identity)
 def login():
     if request.method == 'POST':
         username = request.form.get('username')
@@ -25,11 +44,16 @@ def login():
 
         # If user is delegate, check if they have a valid session
         if user.role == 'delegate':
-            current_session = session.get('current_session')
+            current_session = get_current_session(include_students=False)
             if current_session:
                 flash('You have an active session. Please end it before logging in again.', 'warning')
                 return redirect(url_for('auth.login'))
 
+        # Upgrade the stored hash when the hashing policy has changed since it was made
+        if needs_rehash(user.password_hash):
+            user.set_password(password)
+            db.session.commit()
+
         login_user(user, remember=remember)
         return redirect(url_for('main.dashboard'))
 
@@ -68,6 +92,7 @@ def signup():
         new_user.set_password(password)
         db.session.add(new_user)
         db.session.commit()
+        invalidate_students()
 
         flash('Account created successfully! You can now log in.', 'success')
         return redirect(url_for('auth.login'))
@@ -80,27 +105,11 @@ def signup():
 def logout():
     # If user is delegate, end any active session
     if current_user.role == 'delegate':
-        current_session = session.get('current_session')
+        current_session = get_current_session()
         if current_session:
-            # Mark all students who haven't completed both QR and Face ID as absent
-            for student_data in current_session['students']:
-                if not student_data.get('qr_scanned') or not student_data.get('face_verified'):
-                    # Create attendance record as absent
-                    from database_models.models import Attendance
-                    from datetime import datetime
-                    attendance = Attendance(
-                        student_matricule=student_data['matricule'],
-                        course=current_session['course'],
-                        date_time=datetime.strptime(f"{current_session['date']} {current_session['time']}",
-                                                    "%Y-%m-%d %H:%M"),
-                        qr_scan_status=student_data.get('qr_scanned', False),
-                        face_id_status=student_data.get('face_verified', False),
-                        final_status='absent',
-                        lecture_description=current_session.get('lecture_description', '')
-                    )
-                    db.session.add(attendance)
-            db.session.commit()
-            session.pop('current_session', None)
+            # Record absences and close the session (same service as end_session)
+            finalize_session(current_session)
+            session.pop(SESSION_KEY, None)
 
     logout_user()
     return redirect(url_for('auth.login'))
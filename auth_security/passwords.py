@@ -0,0 +1,154 @@
+from flask import current_app
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+import os
+import threading
+import time
+
+
+class HashingBusy(Exception):
+    """Raised when every password-verification slot is taken; the client should retry later."""
+
+
+class PasswordVerifier:
+    """Bounded pool that runs password hash checks off the request threads.
+
+    Werkzeug's pbkdf2 and scrypt run inside OpenSSL without holding the GIL,
+    so ``workers`` threads use at most that many cores however many logins
+    arrive at once; the rest of the app keeps the remaining CPU. At most
+    ``max_pending`` checks may be queued or running; a request that can't get
+    a slot within ``timeout`` seconds gets HashingBusy instead of piling up.
+    """
+
+    def __init__(self, workers, max_pending, timeout):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.max_pending_seen = 0
+        self.completed = 0
+        self.rejected = 0
+        self.seconds = 0.0
+
+    def _run(self, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self.pending -= 1
+                self.completed += 1
+                self.seconds += time.perf_counter() - start
+            self._slots.release()
+
+    def submit(self, func, *args):
+        """Run ``func(*args)`` on the pool and wait for its result."""
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self.rejected += 1
+            raise HashingBusy()
+        with self._lock:
+            self.pending += 1
+            self.max_pending_seen = max(self.max_pending_seen, self.pending)
+        return self._executor.submit(self._run, func, *args).result()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'pending': self.pending,
+                'max_pending_seen': self.max_pending_seen,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'seconds': self.seconds,
+            }
+
+
+def get_password_verifier():
+    """Return the verification pool of the current app (PASSWORD_HASH_* settings)."""
+    verifier = current_app.extensions.get('password_verifier')
+    if verifier is None:
+        config = current_app.config
+        workers = config.get('PASSWORD_HASH_WORKERS') or max(1, (os.cpu_count() or 2) // 2)
+        verifier = current_app.extensions.setdefault('password_verifier', PasswordVerifier(
+            workers, config.get('PASSWORD_HASH_MAX_PENDING', workers * 8),
+            config.get('PASSWORD_HASH_QUEUE_TIMEOUT', 5.0)
+        ))
+    return verifier
+
+
+_method_prefixes = {}
+
+
+def _method_prefix(method):
+    # Werkzeug fills in default parameters ("pbkdf2" -> "pbkdf2:sha256:600000"),
+    # so read the effective prefix off a real hash once per configured method
+    if method not in _method_prefixes:
+        _method_prefixes[method] = generate_password_hash('', method=method).split('$', 1)[0]
+    return _method_prefixes[method]
+
+
+def hash_password(password):
+    """Hash with the configured algorithm and cost (PASSWORD_HASH_METHOD)."""
+    config = current_app.config
+    return generate_password_hash(password, method=config.get('PASSWORD_HASH_METHOD', 'scrypt'),
+                                  salt_length=config.get('PASSWORD_SALT_LENGTH', 16))
+
+
+def verify_password(pwhash, password):
+    """Check ``password`` against ``pwhash`` on the bounded pool; raises HashingBusy."""
+    return get_password_verifier().submit(check_password_hash, pwhash, password)
+
+
+def needs_rehash(pwhash):
+    """True if ``pwhash`` was made with a different algorithm, cost or salt length than the current policy."""
+    config = current_app.config
+    prefix, _, rest = pwhash.partition('$')
+    salt = rest.partition('$')[0]
+    return (prefix != _method_prefix(config.get('PASSWORD_HASH_METHOD', 'scrypt'))
+            or len(salt) != config.get('PASSWORD_SALT_LENGTH', 16))
+
+
+def _benchmark(method='pbkdf2:sha256:600000', logins=64, concurrency=(1, 8, 32)):
+    """Login throughput with checks inline vs on the pool (``python -m auth_security.passwords``).
+
+    Alongside the logins, a cheap task stands in for scan requests; its
+    latency shows how much the login burst slows the rest of the app.
+    """
+    pwhash = generate_password_hash('secret', method=method)
+    workers = max(1, (os.cpu_count() or 2) // 2)
+
+    def light_request_latency(stop):
+        samples = []
+        while not stop.is_set():
+            start = time.perf_counter()
+            sum(range(2000))
+            samples.append(time.perf_counter() - start)
+            time.sleep(0.005)
+        samples.sort()
+        return samples[int(len(samples) * 0.95)] if samples else 0.0
+
+    for threads in concurrency:
+        for label, pool in (('inline', None), ('pool', PasswordVerifier(workers, threads * 4, 30))):
+            def login():
+                if pool is None:
+                    return check_password_hash(pwhash, 'secret')
+                return pool.submit(check_password_hash, pwhash, 'secret')
+
+            stop = threading.Event()
+            with ThreadPoolExecutor(max_workers=1) as probe, ThreadPoolExecutor(max_workers=threads) as clients:
+                light = probe.submit(light_request_latency, stop)
+                start = time.perf_counter()
+                list(clients.map(lambda _: login(), range(logins)))
+                elapsed = time.perf_counter() - start
+                stop.set()
+                p95 = light.result()
+            print(f"{threads:>3} clients  {label:<6}  {logins / elapsed:7.1f} logins/s  "
+                  f"other requests p95 {p95 * 1e3:7.2f} ms")
+
+
+if __name__ == '__main__':
+    _benchmark()
@@ -0,0 +1,181 @@
+from flask import current_app, request, session, jsonify
+from werkzeug.exceptions import TooManyRequests
+from collections import OrderedDict
+from functools import wraps
+from database_models.sqlite_store import SqliteStore
+import math
+import os
+import threading
+import time
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600}
+
+
+def parse_limit(limit):
+    """``"10/minute"`` -> ``(rate per second, burst)``; the burst is the count itself."""
+    count, _, period = limit.partition('/')
+    count = float(count)
+    return count / PERIODS[period.strip()], count
+
+
+def _refill(tokens, updated, now, rate, burst, cost):
+    """Token-bucket step: returns ``(allowed, tokens left, seconds until allowed)``."""
+    tokens = min(burst, tokens + (now - updated) * rate)
+    if tokens >= cost:
+        return True, tokens - cost, 0.0
+    return False, tokens, (cost - tokens) / rate
+
+
+class MemoryRateLimitBackend:
+    """Buckets in a dict, per process; least recently used buckets are dropped past ``max_entries``."""
+
+    def __init__(self, app=None, max_entries=100000):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost=1, now=None):
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            allowed, tokens, retry_after = _refill(tokens, updated, now, rate, burst, cost)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+
+class SqliteRateLimitBackend(SqliteStore):
+    """Buckets in a WAL-mode SQLite file, shared by every worker on the host.
+
+    Each check is one ``BEGIN IMMEDIATE`` read-modify-write of a single row,
+    so concurrent workers never hand out the same token twice.
+    """
+
+    SCHEMA = ('CREATE TABLE IF NOT EXISTS buckets ('
+              ' key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL) WITHOUT ROWID',)
+    TIMEOUT = 5
+    SYNCHRONOUS = 'OFF'  # buckets are disposable
+
+    def __init__(self, app=None, path=None):
+        if path is None:
+            path = app.config.get('RATE_LIMIT_DB') or os.path.join(app.instance_path, 'rate_limits.db')
+        super().__init__(path)
+
+    def take(self, key, rate, burst, cost=1, now=None):
+        # Wall-clock time: monotonic clocks aren't comparable across processes
+        now = now if now is not None else time.time()
+        with self._transaction() as conn:
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row if row is not None else (burst, now)
+            allowed, tokens, retry_after = _refill(tokens, min(updated, now), now, rate, burst, cost)
+            conn.execute('INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?) '
+                         'ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated',
+                         (key, tokens, now))
+        return allowed, retry_after
+
+
+BACKENDS = {
+    'memory': MemoryRateLimitBackend,
+    'sqlite': SqliteRateLimitBackend,
+}
+
+
+class RateLimiter:
+    """Per-endpoint token buckets: per identity, per client address, and one shared by everybody.
+
+    ``limits`` maps an endpoint name to ``{'identity': '10/minute', 'address':
+    '100/minute', 'total': '100/second'}`` (any may be left out). The identity
+    bucket stops one client retrying in a loop; the address bucket stops one
+    address cycling through identities; the total bucket caps what the
+    endpoint admits overall, so a burst is shed before it reaches the database.
+    """
+
+    def __init__(self, backend, limits):
+        self.backend = backend
+        self.limits = {endpoint: {scope: parse_limit(limit) for scope, limit in scopes.items()}
+                       for endpoint, scopes in limits.items()}
+        self._lock = threading.Lock()
+        self.allowed = {}
+        self.limited = {}
+
+    def check(self, endpoint, identity, address=None):
+        """Return 0 if the request may proceed, else the seconds to wait before retrying."""
+        scopes = self.limits.get(endpoint)
+        if not scopes:
+            return 0
+        for scope, key in (('identity', f"{endpoint}:{identity}"), ('address', f"{endpoint}:ip:{address}"),
+                           ('total', f"{endpoint}:*")):
+            if scope not in scopes:
+                continue
+            rate, burst = scopes[scope]
+            allowed, retry_after = self.backend.take(key, rate, burst)
+            if not allowed:
+                self._count(self.limited, endpoint, scope)
+                return retry_after
+        self._count(self.allowed, endpoint, None)
+        return 0
+
+    def _count(self, counters, endpoint, scope):
+        key = (endpoint, scope) if scope else endpoint
+        with self._lock:
+            counters[key] = counters.get(key, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {'allowed': dict(self.allowed), 'limited': dict(self.limited)}
+
+
+def get_rate_limiter():
+    """Return the rate limiter configured for the current app (RATE_LIMIT_* settings)."""
+    limiter = current_app.extensions.get('rate_limiter')
+    if limiter is None:
+        config = current_app.config
+        backend = BACKENDS[config.get('RATE_LIMIT_BACKEND', 'memory')](current_app)
+        limiter = current_app.extensions.setdefault('rate_limiter', RateLimiter(backend, config.get('RATE_LIMITS', {})))
+    return limiter
+
+
+def client_identity():
+    """The logged-in user's id from the session cookie (no DB lookup), else the client address."""
+    user_id = session.get('_user_id')
+    return f"user:{user_id}" if user_id else f"ip:{request.remote_addr}"
+
+
+def login_identity():
+    """Client address plus the username being signed in to.
+
+    Users behind one NAT or proxy get separate buckets, and nobody can use
+    up another user's bucket from a different address. An address cycling
+    through usernames is stopped by the endpoint's ``address`` limit.
+    """
+    username = (request.form.get('username') or '').strip().lower()
+    return f"login:{request.remote_addr}:{username}" if username else client_identity()
+
+
+def rate_limited(methods=('POST',), identity=client_identity):
+    """Apply the endpoint's RATE_LIMITS before the view (and any DB work) runs.
+
+    Put it above ``login_required`` so rejected requests never load the user.
+    ``identity`` returns the key of the per-identity bucket (client_identity
+    by default).
+    Limited requests get 429 with Retry-After: JSON for JSON requests,
+    otherwise the standard error page.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if current_app.config.get('RATE_LIMIT_ENABLED', True) and request.method in methods:
+                retry_after = get_rate_limiter().check(request.endpoint, identity(), request.remote_addr)
+                if retry_after:
+                    retry_after = max(1, math.ceil(retry_after))
+                    if request.is_json:
+                        response = jsonify({'success': False, 'message': 'Too many requests, please retry shortly'})
+                        response.status_code = 429
+                        response.headers['Retry-After'] = str(retry_after)
+                        return response
+                    raise TooManyRequests(retry_after=retry_after)
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
@@ -0,0 +1,149 @@
+import click
+
+
+def register_commands(app):
+    """Attach the app's maintenance commands to the ``flask`` CLI."""
+
+    @app.cli.command('finalize-sessions')
+    def finalize_sessions_command():
+        """Record absences for live sessions that were never ended.
+
+        Needs LIVE_SESSION_BACKEND=sqlite: the command runs in its own
+        process, which can't see the web workers' in-memory sessions.
+        """
+        from dashboards.finalize import finalize_expired_sessions
+        if app.config.get('LIVE_SESSION_BACKEND', 'memory') == 'memory':
+            raise click.ClickException(
+                "LIVE_SESSION_BACKEND is 'memory', so live sessions only exist inside the web "
+                "process and this command can't see them. Set LIVE_SESSION_BACKEND=sqlite "
+                "(and the same LIVE_SESSION_DB) for the app and for cron.")
+        results = finalize_expired_sessions()
+        for session_id, written in results.items():
+            click.echo(f"Finalised session {session_id}: {written} absence record(s) written")
+        click.echo(f"{len(results)} expired session(s) finalised.")
+
+    @app.cli.command('rebuild-attendance-summary')
+    def rebuild_attendance_summary_command():
+        """Recompute the per-student/course/term attendance rollup from scratch."""
+        from database_models.extensions import db
+        from database_models.models import rebuild_attendance_summary
+        written = rebuild_attendance_summary()
+        db.session.commit()
+        click.echo(f"{written} summary row(s) rebuilt.")
+
+    @app.cli.command('import-qr-attendance')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--course', help='Course to record the rows under (defaults to QR_FACE_COURSE).')
+    @click.option('--batch-size', default=1000, show_default=True)
+    def import_qr_attendance_command(path, course, batch_size):
+        """Load an old qr_face attendance.csv into the attendance table.
+
+        Safe to re-run: rows already imported are skipped by the unique index.
+        """
+        import csv
+        from datetime import datetime
+        from database_models.extensions import db
+        from database_models.models import Student, insert_attendance
+        course = course or app.config.get('QR_FACE_COURSE', 'General')
+        imported = skipped = 0
+
+        def flush(batch):
+            # Rows for students that don't exist would break the foreign key
+            known = {m for (m,) in db.session.query(Student.matricule).filter(
+                Student.matricule.in_({row['student_matricule'] for row in batch}))}
+            rows = [row for row in batch if row['student_matricule'] in known]
+            written = insert_attendance(rows)
+            db.session.commit()
+            return written, len(batch) - len(rows)
+
+        with open(path, newline='') as f:
+            batch = []
+            for line, record in enumerate(csv.DictReader(f), start=2):
+                try:
+                    status = record['status'].strip().lower()
+                    if status not in ('present', 'absent'):
+                        raise ValueError(status)
+                    batch.append({
+                        'student_matricule': record['student_id'].strip(),
+                        'course': course,
+                        'date_time': datetime.strptime(record['timestamp'].strip(), '%Y-%m-%d %H:%M:%S'),
+                        'qr_scan_status': status == 'present',
+                        'face_id_status': status == 'present',
+                        'final_status': status
+                    })
+                except (KeyError, ValueError, AttributeError):
+                    click.echo(f"Line {line}: unreadable row skipped", err=True)
+                    skipped += 1
+                    continue
+                if len(batch) >= batch_size:
+                    written, unknown = flush(batch)
+                    imported, skipped = imported + written, skipped + unknown
+                    batch = []
+            if batch:
+                written, unknown = flush(batch)
+                imported, skipped = imported + written, skipped + unknown
+        click.echo(f"{imported} record(s) imported, {skipped} row(s) skipped.")
+
+    @app.cli.command('import-students')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--photos', type=click.Path(exists=True, dir_okay=False), help='Zip of student photos.')
+    @click.option('--chunk-size', type=int, help='Rows per transaction (defaults to STUDENT_IMPORT_CHUNK_SIZE).')
+    def import_students_command(path, photos, chunk_size):
+        """Bulk-import students from a .csv or .xlsx roster."""
+        import zipfile
+        from database_models.rosters import invalidate_students
+        from database_models.student_import import StudentImport, read_rows
+        from qr_face.enrollment import enroll_students
+        archive = zipfile.ZipFile(photos) if photos else None
+        try:
+            with open(path, 'rb') as f:
+                try:
+                    rows = read_rows(f, path)
+                except ValueError as e:
+                    raise click.ClickException(str(e))
+                result = StudentImport(photos=archive, chunk_size=chunk_size).run(rows)
+        finally:
+            if archive is not None:
+                archive.close()
+        invalidate_students()
+        for line, message in result.errors:
+            click.echo(f"Line {line}: {message}", err=True)
+        if result.error_count > len(result.errors):
+            click.echo(f"... {result.error_count - len(result.errors)} more error(s)", err=True)
+        enrolled = enroll_students([matricule for matricule, picture in result.imported if picture])
+        click.echo(f"{len(result.imported)} student(s) imported, {result.error_count} error(s); "
+                   f"{enrolled} face index(es) rebuilt.")
+
+    @app.cli.command('enroll-faces')
+    @click.option('--level', type=int, help='Only enroll students of this level.')
+    def enroll_faces_command(level):
+        """Compute missing or outdated face encodings and rebuild the face indexes."""
+        from database_models.extensions import db
+        from database_models.models import Student
+        from qr_face.enrollment import enroll_student, rebuild_level_index
+        query = db.session.query(Student.matricule).filter(Student.picture.isnot(None))
+        if level is not None:
+            query = query.filter(Student.level == level)
+        updated = sum(1 for (matricule,) in query.all() if enroll_student(matricule, rebuild_index=False))
+        levels = [level] if level is not None else [lvl for (lvl,) in db.session.query(Student.level).distinct()]
+        for lvl in levels:
+            rebuild_level_index(lvl)
+        click.echo(f"{updated} encoding(s) updated; {len(levels)} face index(es) rebuilt.")
+
+    @app.cli.command('promote-students')
+    @click.option('--dry-run', is_flag=True, help='Only report how many students each level would promote.')
+    def promote_students_command(dry_run):
+        """Move every student below level 4 up one level and rebuild the face indexes."""
+        from database_models.models import promote_students
+        counts = promote_students(dry_run=dry_run)
+        if not dry_run:
+            from database_models.rosters import invalidate_students
+            from qr_face.enrollment import rebuild_level_index
+            invalidate_students()
+            # Every promoted student moved index: rebuild the levels they left and joined
+            for level in sorted(set(counts) | {level + 1 for level in counts}):
+                rebuild_level_index(level)
+        for level, count in counts.items():
+            click.echo(f"Level {level} -> {level + 1}: {count} student(s)")
+        verb = 'would be' if dry_run else 'were'
+        click.echo(f"{sum(counts.values())} student(s) {verb} promoted.")
@@ -1,10 +1,16 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app, jsonify, \
-    send_file
+    send_file, make_response, abort, Response
 from flask_login import login_required, current_user
-from database_models.models import Student, Attendance
+from database_models.models import Student, Attendance, insert_attendance
 from database_models.extensions import db
+from dashboards.live_session import SESSION_KEY, get_store, get_current_session, new_session_id
+from dashboards.finalize import finalize_session
+from database_models.rosters import level_roster
+from qr_face.qr_render import get_qr_cache, qr_key
+from qr_face.qr_batch import generate_batch
+from qr_face.tokens import make_token
+from database_models.exports import XLSX_MIMETYPE, format_datetime, stream_rows, write_xlsx
 from datetime import datetime, timedelta
-import qrcode
 import os
 import sys
 
@@ -12,8 +18,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import mock_cv2 as cv2
 import mock_face_recognition as face_recognition
 from werkzeug.utils import secure_filename
-import io
-import base64
+import json
 import time
 import numpy as np
 from PIL import Image
@@ -29,10 +34,10 @@ def delegate_dashboard():
         return redirect(url_for('main.dashboard'))
 
     delegate_student = Student.query.get(current_user.matricule)
-    students = Student.query.filter_by(level=delegate_student.level).all()
+    students = level_roster(delegate_student.level)
 
     # Get current session info
-    current_session = session.get('current_session')
+    current_session = get_current_session()
 
     # Get attendance records for this delegate's level
     attendance_records = db.session.query(Attendance, Student).join(
@@ -65,66 +70,58 @@ def start_session():
     level = delegate_student.level
 
     # Get all students in the delegate's level (excluding the delegate)
-    students = Student.query.filter_by(level=level).filter(Student.matricule != current_user.matricule).all()
+    students = [student for student in level_roster(level) if student['matricule'] != current_user.matricule]
 
-    # Create session with list of students
-    session['current_session'] = {
+    # Session fields; the roster itself is added to the store below
+    started = datetime.now()
+    qr_expiry = started + timedelta(minutes=30)
+    session_data = {
         'course': course,
         'date': date,
         'time': time,
         'lecture_description': lecture_description,
-        'students': [],
-        'start_time': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        'qr_expiry': (datetime.now() + timedelta(minutes=30)).strftime("%Y-%m-%d %H:%M:%S"),
-        'level': level
+        'start_time': started.strftime("%Y-%m-%d %H:%M:%S"),
+        'qr_expiry': qr_expiry.strftime("%Y-%m-%d %H:%M:%S"),
+        'level': level,
+        'delegate_matricule': delegate_student.matricule
     }
 
-    # Auto-mark delegate as present (as per requirement)
-    # Check if delegate already has an attendance record for this session
-    existing_delegate_attendance = Attendance.query.filter_by(
-        student_matricule=delegate_student.matricule,
-        course=course,
-        date_time=datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M")
-    ).first()
-
-    if not existing_delegate_attendance:
-        attendance = Attendance(
-            student_matricule=delegate_student.matricule,
-            course=course,
-            date_time=datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M"),
-            qr_scan_status=True,
-            face_id_status=True,
-            final_status='present',
-            lecture_description=lecture_description
-        )
-        db.session.add(attendance)
-        db.session.commit()
-
-    # Generate QR codes for all students in the level (excluding the delegate)
+    # Auto-mark delegate as present (as per requirement); the unique index
+    # skips the insert if the delegate already has a record for this session
+    insert_attendance([{
+        'student_matricule': delegate_student.matricule,
+        'course': course,
+        'date_time': datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M"),
+        'qr_scan_status': True,
+        'face_id_status': True,
+        'final_status': 'present',
+        'lecture_description': lecture_description
+    }])
+    db.session.commit()
+
+    # Build the roster for all students in the level (excluding the delegate).
+    # Each QR code is a signed token for (session, student, expiry); images
+    # are rendered lazily by the qr_code endpoint when first viewed.
+    session_id = new_session_id()
+    roster = []
     for student in students:
-        # Create QR code data with student info and timestamp
-        qr_data = f"{student.matricule}-{course}-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-
-        # Generate QR code
-        qr_img = qrcode.make(qr_data)
-
-        # Convert to base64 for display
-        qr_buffer = io.BytesIO()
-        qr_img.save(qr_buffer, format="PNG")
-        qr_buffer.seek(0)
-        qr_base64 = base64.b64encode(qr_buffer.getvalue()).decode('utf-8')
-
-        # Add to session
-        session['current_session']['students'].append({
-            'matricule': student.matricule,
-            'name': student.name,
+        roster.append({
+            'matricule': student['matricule'],
+            'name': student['name'],
             'qr_scanned': False,
             'face_verified': False,
-            'qr_code': qr_base64
+            'qr_data': make_token(session_id, student['matricule'], qr_expiry)
         })
 
-    # Update session
-    session.modified = True
+    # Optionally warm the shared QR disk cache in one parallel batch
+    qr_cache = get_qr_cache()
+    if current_app.config.get('QR_PREGENERATE') and qr_cache.disk_dir:
+        generate_batch([{'qr_data': entry['qr_data'], 'path': qr_cache.disk_path(qr_key(entry['qr_data']))}
+                        for entry in roster],
+                       workers=current_app.config.get('QR_BATCH_WORKERS'))
+
+    # Keep the session server-side; the cookie only carries its id
+    session[SESSION_KEY] = get_store().create(session_data, roster, session_id=session_id)
 
     # Send notification to students
     # In a real application, this would send emails or push notifications
@@ -132,6 +129,81 @@ def start_session():
     return redirect(url_for('delegate.delegate_dashboard'))
 
 
+@delegate.route('/qr/<session_id>/<matricule>.png')
+@login_required
+def qr_code(session_id, matricule):
+    store = get_store()
+    current_session = store.get(session_id, include_students=False)
+    entry = store.get_student(session_id, matricule)
+    if not current_session or not entry:
+        abort(404)
+
+    # Only the session's delegate and the student themselves may see the code
+    if current_user.matricule not in (current_session.get('delegate_matricule'), matricule):
+        abort(403)
+
+    png, key = get_qr_cache().get(entry['qr_data'])
+    response = make_response(png)
+    response.mimetype = 'image/png'
+    response.set_etag(key)
+    response.cache_control.private = True
+    response.cache_control.max_age = current_app.config.get('QR_CACHE_MAX_AGE', 1800)
+    return response.make_conditional(request)
+
+
+@delegate.route('/events')
+@login_required
+def session_events():
+    """Server-Sent Events stream of QR scans and Face ID checks in the delegate's live session.
+
+    Each roster update is sent as a ``student`` event whose id is the store's
+    sequence number, so a reconnecting EventSource resumes from Last-Event-ID.
+    The store is polled every LIVE_EVENTS_POLL_INTERVAL seconds (no database
+    queries), idle streams get a keep-alive comment, and an ``ended`` event is
+    sent once the session is gone. The stream closes after
+    LIVE_EVENTS_MAX_DURATION seconds and the browser reconnects by itself.
+    """
+    if current_user.role != 'delegate':
+        abort(403)
+    current_session = get_current_session(include_students=False)
+    if not current_session:
+        abort(404)
+
+    session_id = current_session['id']
+    store = get_store()
+    poll_interval = current_app.config.get('LIVE_EVENTS_POLL_INTERVAL', 1.0)
+    keepalive = current_app.config.get('LIVE_EVENTS_KEEPALIVE', 15)
+    max_duration = current_app.config.get('LIVE_EVENTS_MAX_DURATION', 55)
+    try:
+        last_seq = int(request.headers.get('Last-Event-ID') or request.args.get('after', 0))
+    except ValueError:
+        last_seq = 0
+
+    # The stream only reads the store; don't keep a pooled DB connection checked out meanwhile
+    db.session.close()
+
+    def generate():
+        seq = last_seq
+        started = last_sent = time.monotonic()
+        yield f"retry: {int(poll_interval * 1000)}\n\n"
+        while time.monotonic() - started < max_duration:
+            events = store.events_since(session_id, seq)
+            if events is None:
+                yield "event: ended\ndata: {}\n\n"
+                return
+            for seq, event in events:
+                yield f"id: {seq}\nevent: student\ndata: {json.dumps(event)}\n\n"
+            if events:
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= keepalive:
+                yield ": keepalive\n\n"
+                last_sent = time.monotonic()
+            time.sleep(poll_interval)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @delegate.route('/end_session', methods=['POST'])
 @login_required
 def end_session():
@@ -139,44 +211,11 @@ def end_session():
         flash('Delegate access required', 'danger')
         return redirect(url_for('main.dashboard'))
 
-    current_session = session.get('current_session')
+    current_session = get_current_session()
     if current_session:
-        # Get delegate's matricule to exclude them from being marked absent
-        delegate_matricule = current_user.matricule
-
-        # Mark all students who haven't completed both QR and Face ID as absent
-        for student_data in current_session['students']:
-            # Skip the delegate
-            if student_data['matricule'] == delegate_matricule:
-                continue
-
-            # Check if student already has an attendance record for this session
-            session_datetime = datetime.strptime(f"{current_session['date']} {current_session['time']}",
-                                                 "%Y-%m-%d %H:%M")
-            existing_attendance = Attendance.query.filter_by(
-                student_matricule=student_data['matricule'],
-                course=current_session['course'],
-                date_time=session_datetime
-            ).first()
-
-            # Only create a new record if one doesn't exist
-            if not existing_attendance and (
-                    not student_data.get('qr_scanned') or not student_data.get('face_verified')):
-                # Create attendance record as absent
-                attendance = Attendance(
-                    student_matricule=student_data['matricule'],
-                    course=current_session['course'],
-                    date_time=session_datetime,
-                    qr_scan_status=student_data.get('qr_scanned', False),
-                    face_id_status=student_data.get('face_verified', False),
-                    final_status='absent',
-                    lecture_description=current_session.get('lecture_description', '')
-                )
-                db.session.add(attendance)
-
-        db.session.commit()
-        session.pop('current_session', None)
-        flash('Session ended and attendance recorded', 'success')
+        written = finalize_session(current_session)
+        session.pop(SESSION_KEY, None)
+        flash(f'Session ended and attendance recorded ({written} absence record(s) written)', 'success')
 
     return redirect(url_for('delegate.delegate_dashboard'))
 
@@ -196,46 +235,34 @@ def export_attendance():
 
     delegate_student = Student.query.get(current_user.matricule)
 
-    # Get attendance records for this delegate's level
-    attendance_records = db.session.query(Attendance, Student).join(
-        Student, Attendance.student_matricule == Student.matricule
-    ).filter(Student.level == delegate_student.level).all()
-
     format = request.args.get('format', 'excel')
 
     if format == 'excel':
-        # Export to Excel
-        from openpyxl import Workbook
-        from io import BytesIO
-
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Attendance Records"
-
-        # Add headers
-        ws.append(["Matricule", "Name", "Course", "Date", "Status", "Lecture Description"])
-
-        # Add data
-        for att, stu in attendance_records:
-            ws.append([
-                att.student_matricule,
-                stu.name,
-                att.course,
-                att.date_time.strftime("%Y-%m-%d %H:%M") if att.date_time else "",
-                att.final_status,
-                att.lecture_description or ""
-            ])
-
-        # Save to a BytesIO object
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
+        # Stream the level's records into a write-only workbook
+        query = db.session.query(
+            Attendance.student_matricule, Student.name, Attendance.course,
+            Attendance.date_time, Attendance.final_status, Attendance.lecture_description
+        ).join(
+            Student, Attendance.student_matricule == Student.matricule
+        ).filter(Student.level == delegate_student.level)
+
+        rows = ([
+            matricule,
+            name,
+            course,
+            format_datetime(date_time),
+            status,
+            lecture or ""
+        ] for matricule, name, course, date_time, status, lecture in stream_rows(query))
+
+        output = write_xlsx(["Matricule", "Name", "Course", "Date", "Status", "Lecture Description"], rows,
+                            title="Attendance Records")
 
         return send_file(
             output,
             as_attachment=True,
             download_name=f"attendance_{datetime.now().strftime('%Y%m%d')}.xlsx",
-            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            mimetype=XLSX_MIMETYPE
         )
 
     elif format == 'pdf':
@@ -245,6 +272,11 @@ def export_attendance():
         from reportlab.lib import colors
         from io import BytesIO
 
+        # Get attendance records for this delegate's level
+        attendance_records = db.session.query(Attendance, Student).join(
+            Student, Attendance.student_matricule == Student.matricule
+        ).filter(Student.level == delegate_student.level).all()
+
         buffer = BytesIO()
         doc = SimpleDocTemplate(buffer, pagesize=letter)
 
@@ -0,0 +1,80 @@
+from flask import current_app
+from database_models.models import Attendance, insert_attendance
+from database_models.extensions import db
+from dashboards.live_session import get_store
+from datetime import datetime, timedelta
+
+
+def session_datetime(current_session):
+    return datetime.strptime(f"{current_session['date']} {current_session['time']}", "%Y-%m-%d %H:%M")
+
+
+def absent_students(current_session):
+    """Roster entries (delegate excluded) that haven't completed both QR and Face ID."""
+    return [student_data for student_data in current_session['students'].values()
+            if student_data['matricule'] != current_session.get('delegate_matricule')
+            and (not student_data.get('qr_scanned') or not student_data.get('face_verified'))]
+
+
+def finalize_session(current_session):
+    """Record absences for a live session and remove it from the store.
+
+    Every roster student who hasn't completed both QR and Face ID is marked
+    absent in one bulk insert, committed as a single transaction. Students
+    who already have a record for the session are left alone, so calling
+    this again after a failure (or from two places at once) never writes a
+    row twice. The session is only removed from the store once the rows are
+    committed. Returns the number of attendance rows written.
+    """
+    when = session_datetime(current_session)
+    absentees = absent_students(current_session)
+
+    # One query for the students who already have a record for this session
+    existing = {matricule for (matricule,) in db.session.query(Attendance.student_matricule).filter(
+        Attendance.course == current_session['course'],
+        Attendance.date_time == when,
+        Attendance.student_matricule.in_([student_data['matricule'] for student_data in absentees])
+    )}
+
+    # Mark all students who haven't completed both QR and Face ID as absent
+    absent_rows = [{
+        'student_matricule': student_data['matricule'],
+        'course': current_session['course'],
+        'date_time': when,
+        'qr_scan_status': student_data.get('qr_scanned', False),
+        'face_id_status': student_data.get('face_verified', False),
+        'final_status': 'absent',
+        'lecture_description': current_session.get('lecture_description', '')
+    } for student_data in absentees if student_data['matricule'] not in existing]
+
+    try:
+        # One bulk insert; rows raced in by another request are skipped by the unique index
+        written = insert_attendance(absent_rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    get_store().delete(current_session['id'])
+    return written
+
+
+def finalize_expired_sessions(now=None):
+    """Finalise every live session older than LIVE_SESSION_MAX_AGE.
+
+    Meant to be run periodically (``flask finalize-sessions`` from cron or a
+    background job) so sessions whose delegate never ended them still get
+    their absences recorded. Returns ``{session_id: rows written}``.
+    """
+    now = now or datetime.now()
+    max_age = timedelta(minutes=current_app.config.get('LIVE_SESSION_MAX_AGE', 180))
+    store = get_store()
+    results = {}
+    for session_id in store.session_ids():
+        current_session = store.get(session_id)
+        if current_session is None:
+            continue
+        started = datetime.strptime(current_session['start_time'], "%Y-%m-%d %H:%M:%S")
+        if now - started >= max_age:
+            results[session_id] = finalize_session(current_session)
+    return results
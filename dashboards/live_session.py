@@ -0,0 +1,274 @@
+from flask import current_app, session
+from database_models.sqlite_store import SqliteStore
+import copy
+import json
+import os
+import threading
+import time
+import uuid
+
+# Key under which the live session id is kept in the Flask cookie session.
+# Only the id travels in the cookie; the session itself lives in the store.
+SESSION_KEY = 'current_session_id'
+
+
+class MemoryLiveSessionStore:
+    """In-process live-session store.
+
+    Sessions are kept in a dict keyed by session id, and each session keeps
+    its roster in a dict keyed by matricule so a single student entry can be
+    read or updated in O(1) without touching the rest of the class. Every
+    roster update is also appended to the session's event log (see
+    events_since).
+    """
+
+    def __init__(self, app=None):
+        self._sessions = {}
+        self._events = {}
+        self._lock = threading.Lock()
+
+    def create(self, data, students, session_id=None):
+        """Store a new session and return its id.
+
+        ``data`` holds the session fields (course, date, time...) and
+        ``students`` is an iterable of roster entries with a ``matricule`` key.
+        Pass ``session_id`` (from new_session_id) when the id must be known
+        before the roster is built, e.g. to sign it into QR codes.
+        """
+        session_id = session_id or new_session_id()
+        record = dict(data)
+        record['id'] = session_id
+        record['created'] = time.time()
+        record['students'] = {entry['matricule']: dict(entry) for entry in students}
+        with self._lock:
+            self._sessions[session_id] = record
+            self._events[session_id] = []
+        return session_id
+
+    def get(self, session_id, include_students=True):
+        """Return a copy of the session, or None.
+
+        Pass ``include_students=False`` to skip copying the roster when only
+        the session fields are needed.
+        """
+        with self._lock:
+            record = self._sessions.get(session_id)
+            if record is None:
+                return None
+            if include_students:
+                return copy.deepcopy(record)
+            return {key: value for key, value in record.items() if key != 'students'}
+
+    def get_student(self, session_id, matricule):
+        """Return a copy of one roster entry, or None."""
+        with self._lock:
+            record = self._sessions.get(session_id)
+            if record is None:
+                return None
+            entry = record['students'].get(matricule)
+            return dict(entry) if entry is not None else None
+
+    def update_student(self, session_id, matricule, expect=None, **changes):
+        """Apply ``changes`` to one roster entry and return the updated copy.
+
+        With ``expect`` (a dict of field values) the change is only applied
+        if the entry still has those values, and False is returned otherwise;
+        e.g. ``expect={'qr_scanned': False}`` lets exactly one scan win.
+        Returns None if the session or student is unknown.
+        """
+        with self._lock:
+            record = self._sessions.get(session_id)
+            if record is None or matricule not in record['students']:
+                return None
+            entry = record['students'][matricule]
+            if expect and any(entry.get(key, False) != value for key, value in expect.items()):
+                return False
+            entry.update(changes)
+            events = self._events[session_id]
+            events.append((len(events) + 1, student_event(entry)))
+            return dict(entry)
+
+    def events_since(self, session_id, seq):
+        """Return ``[(seq, event)]`` of roster updates after ``seq``, or None if the session is gone.
+
+        Sequence numbers start at 1 and increase by one per update.
+        """
+        with self._lock:
+            events = self._events.get(session_id)
+            return list(events[seq:]) if events is not None else None
+
+    def active_for_level(self, level):
+        """Return the id of the newest session of ``level``, or None."""
+        with self._lock:
+            candidates = [record for record in self._sessions.values() if record.get('level') == level]
+            if not candidates:
+                return None
+            return max(candidates, key=lambda record: record['created'])['id']
+
+    def session_ids(self):
+        """Return the ids of all stored sessions."""
+        with self._lock:
+            return list(self._sessions)
+
+    def delete(self, session_id):
+        """Remove the session and return it, or None if it was not stored."""
+        with self._lock:
+            self._events.pop(session_id, None)
+            return self._sessions.pop(session_id, None)
+
+
+class SqliteLiveSessionStore(SqliteStore):
+    """Live-session store in a SQLite database in WAL mode, shared by every worker on the host.
+
+    Each roster entry is its own row keyed by (session id, matricule), so a
+    scan rewrites one small row instead of the whole class. Updates run in
+    ``BEGIN IMMEDIATE`` transactions: concurrent writers queue on the
+    database lock (up to ``busy_timeout``) and never overwrite each other's
+    changes, while WAL lets readers carry on during a write (see SqliteStore).
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS live_sessions ("
+        " id TEXT PRIMARY KEY, level INTEGER, created REAL NOT NULL, data TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_live_sessions_level ON live_sessions (level, created)",
+        "CREATE TABLE IF NOT EXISTS live_session_students ("
+        " session_id TEXT NOT NULL, matricule TEXT NOT NULL, position INTEGER NOT NULL, data TEXT NOT NULL,"
+        " PRIMARY KEY (session_id, matricule)) WITHOUT ROWID",
+        "CREATE TABLE IF NOT EXISTS live_session_events ("
+        " session_id TEXT NOT NULL, seq INTEGER NOT NULL, data TEXT NOT NULL,"
+        " PRIMARY KEY (session_id, seq)) WITHOUT ROWID",
+    )
+
+    def __init__(self, app=None, path=None):
+        if path is None:
+            path = app.config.get('LIVE_SESSION_DB') or os.path.join(app.instance_path, 'live_sessions.db')
+        super().__init__(path)
+
+    def create(self, data, students, session_id=None):
+        """Store a new session and return its id (see MemoryLiveSessionStore.create)."""
+        session_id = session_id or new_session_id()
+        with self._transaction() as conn:
+            conn.execute('INSERT INTO live_sessions (id, level, created, data) VALUES (?, ?, ?, ?)',
+                         (session_id, data.get('level'), time.time(), json.dumps(data)))
+            conn.executemany('INSERT INTO live_session_students (session_id, matricule, position, data) '
+                             'VALUES (?, ?, ?, ?)',
+                             [(session_id, entry['matricule'], position, json.dumps(entry))
+                              for position, entry in enumerate(students)])
+        return session_id
+
+    def get(self, session_id, include_students=True):
+        conn = self._connection()
+        row = conn.execute('SELECT data FROM live_sessions WHERE id = ?', (session_id,)).fetchone()
+        if row is None:
+            return None
+        record = json.loads(row[0])
+        record['id'] = session_id
+        if include_students:
+            record['students'] = {matricule: json.loads(entry) for matricule, entry in conn.execute(
+                'SELECT matricule, data FROM live_session_students WHERE session_id = ? ORDER BY position',
+                (session_id,))}
+        return record
+
+    def get_student(self, session_id, matricule):
+        row = self._connection().execute(
+            'SELECT data FROM live_session_students WHERE session_id = ? AND matricule = ?',
+            (session_id, matricule)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def update_student(self, session_id, matricule, expect=None, **changes):
+        """Row-level update of one roster entry (see MemoryLiveSessionStore.update_student)."""
+        with self._transaction() as conn:
+            row = conn.execute('SELECT data FROM live_session_students WHERE session_id = ? AND matricule = ?',
+                               (session_id, matricule)).fetchone()
+            if row is None:
+                return None
+            entry = json.loads(row[0])
+            if expect and any(entry.get(key, False) != value for key, value in expect.items()):
+                return False
+            entry.update(changes)
+            conn.execute('UPDATE live_session_students SET data = ? WHERE session_id = ? AND matricule = ?',
+                         (json.dumps(entry), session_id, matricule))
+            # Same transaction, so sequence numbers are gap-free and in commit order
+            conn.execute('INSERT INTO live_session_events (session_id, seq, data) '
+                         'SELECT ?, COALESCE(MAX(seq), 0) + 1, ? FROM live_session_events WHERE session_id = ?',
+                         (session_id, json.dumps(student_event(entry)), session_id))
+        return entry
+
+    def events_since(self, session_id, seq):
+        conn = self._connection()
+        events = [(row_seq, json.loads(data)) for row_seq, data in conn.execute(
+            'SELECT seq, data FROM live_session_events WHERE session_id = ? AND seq > ? ORDER BY seq',
+            (session_id, seq))]
+        if not events and conn.execute('SELECT 1 FROM live_sessions WHERE id = ?', (session_id,)).fetchone() is None:
+            return None
+        return events
+
+    def active_for_level(self, level):
+        row = self._connection().execute(
+            'SELECT id FROM live_sessions WHERE level = ? ORDER BY created DESC LIMIT 1', (level,)).fetchone()
+        return row[0] if row is not None else None
+
+    def session_ids(self):
+        return [session_id for (session_id,) in self._connection().execute('SELECT id FROM live_sessions')]
+
+    def delete(self, session_id):
+        """Remove the session and return it, or None if it was not stored."""
+        with self._transaction():
+            record = self.get(session_id)
+            if record is not None:
+                conn = self._connection()
+                conn.execute('DELETE FROM live_session_students WHERE session_id = ?', (session_id,))
+                conn.execute('DELETE FROM live_session_events WHERE session_id = ?', (session_id,))
+                conn.execute('DELETE FROM live_sessions WHERE id = ?', (session_id,))
+        return record
+
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+
+def student_event(entry):
+    """Event payload for a roster update; the signed QR token is left out."""
+    return {key: value for key, value in entry.items() if key != 'qr_data'}
+
+
+BACKENDS = {
+    'memory': MemoryLiveSessionStore,
+    'sqlite': SqliteLiveSessionStore,
+}
+
+
+def get_store():
+    """Return the live-session store configured for the current app."""
+    store = current_app.extensions.get('live_sessions')
+    if store is None:
+        backend = current_app.config.get('LIVE_SESSION_BACKEND', 'memory')
+        store = current_app.extensions.setdefault('live_sessions', BACKENDS[backend](current_app))
+    return store
+
+
+def current_session_id():
+    return session.get(SESSION_KEY)
+
+
+def get_current_session(include_students=True):
+    """Return the live session referenced by the cookie, if it still exists."""
+    session_id = current_session_id()
+    if not session_id:
+        return None
+    current_session = get_store().get(session_id, include_students=include_students)
+    if current_session is None:
+        # The store no longer knows this id (ended elsewhere or restarted)
+        session.pop(SESSION_KEY, None)
+    return current_session
+
+
+def get_level_session(level, include_students=True):
+    """Return the live session running for ``level``.
+
+    Students never hold the delegate's session id in their own cookie, so
+    they find the session of their class by level instead.
+    """
+    store = get_store()
+    session_id = store.active_for_level(level)
+    return store.get(session_id, include_students=include_students) if session_id else None
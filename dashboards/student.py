@@ -1,8 +1,11 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app, jsonify
 from flask_login import login_required, current_user
-from database_models.models import Student, Attendance
+from database_models.models import Student, Attendance, AttendanceSummary
 from database_models.extensions import db
-from datetime import datetime, timedelta
+from dashboards.live_session import get_store, get_level_session
+from qr_face.tokens import InvalidToken, read_token, get_seen_tokens
+from auth_security.rate_limit import rate_limited
+from datetime import datetime
 import qrcode
 import os
 import sys
@@ -25,13 +28,24 @@ def student_dashboard():
         return redirect(url_for('main.dashboard'))
 
     student_data = Student.query.get(current_user.matricule)
-    attendance_records = Attendance.query.filter_by(student_matricule=current_user.matricule).all()
+
+    # Totals come from the rollup table instead of scanning the full history
+    present, absent, total = db.session.query(
+        db.func.coalesce(db.func.sum(AttendanceSummary.present), 0),
+        db.func.coalesce(db.func.sum(AttendanceSummary.absent), 0),
+        db.func.coalesce(db.func.sum(AttendanceSummary.total), 0)
+    ).filter(AttendanceSummary.student_matricule == current_user.matricule).one()
+    attendance_stats = {'present': present, 'absent': absent, 'total': total}
+
+    attendance_records = Attendance.query.filter_by(student_matricule=current_user.matricule).order_by(
+        Attendance.date_time.desc()
+    ).limit(current_app.config.get('STUDENT_RECENT_RECORDS', 50)).all()
 
     # Get notifications
     notifications = session.get('notifications', [])
 
-    # Get current session info if available
-    current_session = session.get('current_session')
+    # Get the live session of the student's level, if one is running
+    current_session = get_level_session(student_data.level)
 
     # Get current date for the form
     current_date = datetime.now().strftime('%Y-%m-%d')
@@ -41,6 +55,7 @@ def student_dashboard():
                            user_name=student_data.name,
                            user_matricule=student_data.matricule,
                            attendance_records=attendance_records,
+                           attendance_stats=attendance_stats,
                            notifications=notifications,
                            current_session=current_session,
                            datetime=datetime,
@@ -48,6 +63,7 @@ def student_dashboard():
 
 
 @student.route('/scan_qr', methods=['POST'])
+@rate_limited()
 @login_required
 def scan_qr():
     if current_user.role != 'student':
@@ -59,35 +75,34 @@ def scan_qr():
     if not qr_data:
         return jsonify({'success': False, 'message': 'No QR data provided'})
 
-    # Get the current session
-    current_session = session.get('current_session')
-    if not current_session:
+    # The QR code is a signed (session, student, expiry) token: checking it
+    # needs neither the cookie session nor a walk over the class roster
+    try:
+        session_id, matricule, expires_at, token_id = read_token(qr_data)
+    except InvalidToken as e:
+        return jsonify({'success': False, 'message': str(e)})
+    if matricule != current_user.matricule:
+        return jsonify({'success': False, 'message': 'This QR code belongs to another student'})
+
+    # Replays of an accepted token are turned away before touching the store
+    seen_tokens = get_seen_tokens()
+    if token_id in seen_tokens:
+        return jsonify({'success': False, 'message': 'You have already scanned your QR code'})
+
+    # Update the student's QR scan status in the store. Roster entries are keyed
+    # by matricule, and the update only applies if the entry isn't scanned yet,
+    # so two workers racing on the same student can't both record it.
+    entry = get_store().update_student(session_id, matricule,
+                                       expect={'qr_scanned': False},
+                                       qr_scanned=True,
+                                       timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    if entry is None:
         return jsonify({'success': False, 'message': 'No active session'})
+    if entry is False:
+        return jsonify({'success': False, 'message': 'You have already scanned your QR code'})
 
-    # Check if the student is in the same level as the session
-    student_data = Student.query.get(current_user.matricule)
-    if student_data.level != current_session.get('level'):
-        return jsonify({'success': False, 'message': 'This session is not for your level'})
-
-    # Check if QR is still valid (30 minutes from session start)
-    session_start = datetime.strptime(current_session['start_time'], "%Y-%m-%d %H:%M:%S")
-    if datetime.now() > session_start + timedelta(minutes=30):
-        return jsonify({'success': False, 'message': 'QR code scanning period has expired'})
-
-    # Check if student has already scanned QR
-    for s in current_session.get('students', []):
-        if s['matricule'] == current_user.matricule and s.get('qr_scanned'):
-            return jsonify({'success': False, 'message': 'You have already scanned your QR code'})
-
-    # Update the student's QR scan status in the session
-    for student in current_session.get('students', []):
-        if student['matricule'] == current_user.matricule:
-            student['qr_scanned'] = True
-            student['timestamp'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            break
-
-    session.modified = True
-
+    # Only a recorded scan burns the token, so a retry after a failed write still counts
+    seen_tokens.add(token_id, expires_at)
     return jsonify({'success': True, 'message': 'QR code scanned successfully'})
 
 
@@ -0,0 +1,147 @@
+from flask import current_app
+from collections import OrderedDict
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+
+class MemoryCacheBackend:
+    """In-process LRU cache with per-entry expiry (the default backend)."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return ``(found, value)`` for ``key``."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FileCacheBackend:
+    """Cache kept as pickle files in a directory, shared by every worker on the host.
+
+    Writes go through a temp file and os.replace, so concurrent workers never
+    read a partial entry.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.cache')
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                expires_at, value = pickle.load(f)
+        except (OSError, EOFError, pickle.PickleError):
+            return False, None
+        if expires_at is not None and expires_at <= time.time():
+            self.delete(key)
+            return False, None
+        return True, value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((expires_at, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.cache'):
+                os.remove(os.path.join(self.directory, name))
+
+
+class Cache:
+    """TTL cache with namespaces, explicit invalidation and hit/miss counters.
+
+    Keys live in a namespace (``'roster'``, ``'admin_counts'``...). A whole
+    namespace is invalidated by bumping its version, which works the same way
+    on every backend without having to enumerate keys.
+    """
+
+    def __init__(self, backend, default_ttl=60):
+        self.backend = backend
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+
+    def _version(self, namespace):
+        found, version = self.backend.get(f"__ns__:{namespace}")
+        return version if found else 0
+
+    def _key(self, namespace, key):
+        return f"{namespace}:v{self._version(namespace)}:{key}"
+
+    def get_or_set(self, namespace, key, factory, ttl=None):
+        """Return the cached value, calling ``factory()`` to fill it on a miss."""
+        full_key = self._key(namespace, key)
+        found, value = self.backend.get(full_key)
+        if found:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = factory()
+        self.backend.set(full_key, value, ttl if ttl is not None else self.default_ttl)
+        return value
+
+    def invalidate(self, namespace, key=None):
+        """Drop one key, or the whole namespace when ``key`` is None."""
+        if key is not None:
+            self.backend.delete(self._key(namespace, key))
+        else:
+            self.backend.set(f"__ns__:{namespace}", self._version(namespace) + 1)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+def get_cache():
+    """Return the cache configured for the current app (CACHE_BACKEND)."""
+    cache = current_app.extensions.get('cache')
+    if cache is None:
+        config = current_app.config
+        if config.get('CACHE_BACKEND', 'memory') == 'file':
+            backend = FileCacheBackend(config.get('CACHE_DIR') or os.path.join(current_app.instance_path, 'cache'))
+        else:
+            backend = MemoryCacheBackend(config.get('CACHE_MAX_ENTRIES', 1024))
+        cache = current_app.extensions.setdefault('cache', Cache(backend, config.get('CACHE_DEFAULT_TTL', 60)))
+    return cache
@@ -4,4 +4,79 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static/uploads')
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max upload size
\ No newline at end of file
+    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max upload size
+    # Where live attendance sessions are kept (only the id goes in the cookie):
+    # "memory" (one process) or "sqlite" (LIVE_SESSION_DB, shared by all workers on the host)
+    LIVE_SESSION_BACKEND = os.getenv("LIVE_SESSION_BACKEND", "memory")
+    LIVE_SESSION_DB = os.getenv("LIVE_SESSION_DB")
+    # Sessions older than this (minutes) are finalised by `flask finalize-sessions`; run from
+    # cron, that command needs the sqlite backend, it can't reach another process's memory
+    LIVE_SESSION_MAX_AGE = int(os.getenv("LIVE_SESSION_MAX_AGE", 180))
+    # Rendered QR codes: in-memory LRU size, optional shared disk cache, browser cache lifetime
+    QR_CACHE_SIZE = int(os.getenv("QR_CACHE_SIZE", 1024))
+    QR_CACHE_DIR = os.getenv("QR_CACHE_DIR")
+    QR_CACHE_MAX_AGE = 30 * 60  # QR codes are only valid for 30 minutes
+    # Batch QR rendering: process pool size (None = one per CPU) and whether
+    # start_session pre-renders the whole roster into QR_CACHE_DIR
+    QR_BATCH_WORKERS = int(os.getenv("QR_BATCH_WORKERS", 0)) or None
+    QR_PREGENERATE = os.getenv("QR_PREGENERATE", "0") == "1"
+    # Admin attendance page: default rows per page and the largest ?per_page allowed
+    ATTENDANCE_PAGE_SIZE = 50
+    ATTENDANCE_MAX_PAGE_SIZE = 500
+    # Number of latest records listed on the student dashboard
+    STUDENT_RECENT_RECORDS = 50
+    # Cache for dashboard counters and level rosters: "memory" (per process)
+    # or "file" (CACHE_DIR, shared by all workers on the host)
+    CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+    CACHE_DIR = os.getenv("CACHE_DIR")
+    CACHE_DEFAULT_TTL = int(os.getenv("CACHE_DEFAULT_TTL", 60))
+    CACHE_MAX_ENTRIES = 1024
+    # Per-level face-encoding index files (defaults to <instance>/face_index)
+    FACE_INDEX_DIR = os.getenv("FACE_INDEX_DIR")
+    # Background threads computing face encodings for uploaded pictures
+    ENROLLMENT_WORKERS = 2
+    # /qr_face/verify_batch: frames are downscaled to FACE_VERIFY_MAX_DIM pixels before
+    # detection; encodings run on a process pool with a bounded number of pending frames
+    FACE_VERIFY_MAX_DIM = 320
+    FACE_VERIFY_MAX_FRAMES = 10
+    FACE_VERIFY_TOLERANCE = 0.6
+    FACE_VERIFY_WORKERS = int(os.getenv("FACE_VERIFY_WORKERS", 0)) or None
+    FACE_VERIFY_MAX_PENDING = 32
+    FACE_VERIFY_QUEUE_TIMEOUT = 2.0
+    # Course the /qr_face class endpoints record attendance under when none is given
+    QR_FACE_COURSE = os.getenv("QR_FACE_COURSE", "General")
+    # /delegate/events (live scan feed): store poll interval, keep-alive and stream lifetime in seconds
+    LIVE_EVENTS_POLL_INTERVAL = 1.0
+    LIVE_EVENTS_KEEPALIVE = 15
+    LIVE_EVENTS_MAX_DURATION = 55
+    # Bulk student import: rows inserted per transaction
+    STUDENT_IMPORT_CHUNK_SIZE = 2000
+    # Browser cache lifetime of picture thumbnails (their URLs are content-addressed)
+    PICTURE_CACHE_MAX_AGE = 365 * 24 * 3600
+    # Password hashing policy (any werkzeug method, e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000");
+    # stored hashes made with other parameters are upgraded at the next login
+    PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt")
+    PASSWORD_SALT_LENGTH = 16
+    # Password checks run on a bounded pool (0 = half the CPUs) so login bursts leave CPU for other requests
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 0)) or None
+    PASSWORD_HASH_MAX_PENDING = 64
+    PASSWORD_HASH_QUEUE_TIMEOUT = 5.0
+    # Token-bucket rate limits per endpoint: "identity" is per logged-in user (or client address
+    # before login; address + submitted username for auth.login), "address" per client address
+    # (sized for a lecture hall behind NAT), "total" is shared by everybody. Backend: "memory"
+    # (per process) or "sqlite" (RATE_LIMIT_DB, shared by all workers on the host)
+    RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+    RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+    RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB")
+    RATE_LIMITS = {
+        "auth.login": {"identity": "10/minute", "address": "300/minute", "total": "50/second"},
+        "student.scan_qr": {"identity": "20/minute", "total": "200/second"},
+    }
+    # Request instrumentation (/metrics): requests running more SQL statements than QUERY_BUDGET
+    # are logged and counted; QUERY_COUNT_HEADER adds X-Query-Count/X-Query-Time to responses.
+    # /metrics is off by default; when on it answers METRICS_TOKEN ("Authorization: Bearer <token>")
+    # or, without a token, only scrapers on localhost
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+    QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", 20))
+    QUERY_COUNT_HEADER = os.getenv("QUERY_COUNT_HEADER", "0") == "1"
\ No newline at end of file
@@ -0,0 +1,69 @@
+from openpyxl import Workbook
+import csv
+import io
+import json
+import tempfile
+
+# Rows fetched from the database per round-trip when streaming an export
+EXPORT_CHUNK_SIZE = 1000
+
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+CSV_MIMETYPE = "text/csv"
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+
+def format_datetime(value):
+    return value.strftime("%Y-%m-%d %H:%M") if value else ""
+
+
+def stream_rows(query, chunk_size=EXPORT_CHUNK_SIZE):
+    """Iterate over ``query`` fetching ``chunk_size`` rows at a time."""
+    return query.execution_options(yield_per=chunk_size, stream_results=True)
+
+
+def write_xlsx(header, rows, title="Sheet"):
+    """Write ``rows`` to a write-only workbook and return it as an open temp file.
+
+    openpyxl's write-only mode flushes each row as it is appended, and the
+    finished workbook is saved to a temporary file rather than a BytesIO, so
+    memory use does not grow with the number of rows.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title)
+    ws.append(header)
+    for row in rows:
+        ws.append(row)
+
+    output = tempfile.TemporaryFile()
+    wb.save(output)
+    output.seek(0)
+    return output
+
+
+def csv_chunks(header, rows, rows_per_chunk=EXPORT_CHUNK_SIZE):
+    """Yield CSV text for ``header`` and ``rows`` in chunks of ``rows_per_chunk`` lines."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= rows_per_chunk:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+
+def ndjson_chunks(fields, rows, rows_per_chunk=EXPORT_CHUNK_SIZE):
+    """Yield one JSON object per row (keyed by ``fields``), batched into chunks."""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(fields, row)), default=str))
+        if len(lines) >= rows_per_chunk:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
@@ -0,0 +1,66 @@
+from datetime import datetime
+from sqlalchemy import text, inspect, String, LargeBinary
+from database_models.extensions import db
+from database_models.models import rebuild_attendance_summary
+
+# Schema changes for databases created before the change reached the models.
+# db.create_all() only creates missing tables, so indexes and columns added
+# to existing tables are applied here. Each step runs once and is recorded in
+# the schema_migrations table; statements are written to be safe to re-run.
+# A step may also be a callable, which is passed the migration's connection.
+def add_column(table, name, type_):
+    """Migration step adding a nullable column unless it already exists."""
+    def step(conn):
+        if name not in {column['name'] for column in inspect(conn).get_columns(table)}:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {type_.compile(dialect=conn.dialect)}"))
+    return step
+
+
+MIGRATIONS = [
+    ('0001_attendance_indexes', [
+        # Keep one record per (student, course, session), preferring a 'present' one,
+        # so the unique index below can be created on existing data
+        """
+        DELETE FROM attendance WHERE id NOT IN (
+            SELECT COALESCE(MIN(CASE WHEN final_status = 'present' THEN id END), MIN(id))
+            FROM attendance
+            GROUP BY student_matricule, course, date_time
+        )
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_attendance_student_course_session "
+        "ON attendance (student_matricule, course, date_time)",
+        "CREATE INDEX IF NOT EXISTS ix_attendance_date_time_id ON attendance (date_time, id)",
+        "CREATE INDEX IF NOT EXISTS ix_students_level ON students (level)",
+    ]),
+    ('0002_attendance_summary_backfill', [
+        # The table itself is created by db.create_all(); fill it from existing records
+        rebuild_attendance_summary,
+    ]),
+    ('0003_student_face_encoding', [
+        add_column('students', 'picture_hash', String(64)),
+        add_column('students', 'face_encoding', LargeBinary()),
+    ]),
+]
+
+
+def upgrade_schema():
+    """Apply any migrations that have not been run against this database yet."""
+    with db.engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "name VARCHAR(100) PRIMARY KEY, applied_at TIMESTAMP NOT NULL)"
+        ))
+        applied = {row[0] for row in conn.execute(text("SELECT name FROM schema_migrations"))}
+
+    for name, statements in MIGRATIONS:
+        if name in applied:
+            continue
+        with db.engine.begin() as conn:
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(text(statement))
+            conn.execute(text("INSERT INTO schema_migrations (name, applied_at) VALUES (:name, :applied_at)"),
+                         {'name': name, 'applied_at': datetime.utcnow()})
+        print(f"🛠️ Applied migration {name}")
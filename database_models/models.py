@@ -1,19 +1,21 @@
 from datetime import datetime
 from database_models.extensions import db  # Changed from 'extensions' to 'database_models.extensions'
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from auth_security.passwords import hash_password, verify_password
 
 # STUDENT MODEL
 class Student(db.Model):
     __tablename__ = 'students'
     matricule = db.Column(db.String(20), primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    level = db.Column(db.Integer, nullable=False)
+    level = db.Column(db.Integer, nullable=False, index=True)
     email = db.Column(db.String(100), unique=True, nullable=False)
     phone = db.Column(db.String(20))
     specialty = db.Column(db.String(50))
     role = db.Column(db.Enum('student', 'delegate', name='role_enum'), default='student')
     picture = db.Column(db.String(255))  # Path to the student's picture
+    picture_hash = db.Column(db.String(64))  # SHA-256 of the picture the encoding was computed from
+    face_encoding = db.Column(db.LargeBinary)  # 128 float32 values, see qr_face.enrollment
     # Relationships
     attendances = db.relationship(
         "Attendance", back_populates="student", cascade="all, delete-orphan", single_parent=True
@@ -35,15 +37,22 @@ class User(UserMixin, db.Model):
     # Relationship
     student = db.relationship("Student", back_populates="user")
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        # Runs on the bounded verification pool; may raise HashingBusy
+        return verify_password(self.password_hash, password)
     def __repr__(self):
         return f"<User {self.username} ({self.role})>"
 
 # ATTENDANCE MODEL
 class Attendance(db.Model):
     __tablename__ = 'attendance'
+    __table_args__ = (
+        # One record per student per session; also serves lookups by student
+        db.Index('uq_attendance_student_course_session', 'student_matricule', 'course', 'date_time', unique=True),
+        # Date ordering / date-range filters and keyset pagination
+        db.Index('ix_attendance_date_time_id', 'date_time', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     student_matricule = db.Column(db.String(20), db.ForeignKey('students.matricule'))
     course = db.Column(db.String(100), nullable=False)
@@ -57,12 +66,182 @@ class Attendance(db.Model):
     def __repr__(self):
         return f"<Attendance {self.student_matricule} - {self.course} - {self.final_status}>"
 
-# HELPER FUNCTION
-def promote_students():
-    """Promotes students to the next level at the start of a new academic year."""
-    students = Student.query.all()
-    for student in students:
-        if student.level < 4:  # Promote up to level 4 only
-            student.level += 1
+# ATTENDANCE SUMMARY MODEL
+class AttendanceSummary(db.Model):
+    """Running present/absent/total counts per student, course and term.
+
+    Kept up to date by insert_attendance() and the attendance deletes, in the
+    same transaction as the rows they count; rebuild_attendance_summary()
+    recomputes it from scratch.
+    """
+    __tablename__ = 'attendance_summary'
+    student_matricule = db.Column(db.String(20), db.ForeignKey('students.matricule'), primary_key=True)
+    course = db.Column(db.String(100), primary_key=True)
+    term = db.Column(db.String(20), primary_key=True)
+    present = db.Column(db.Integer, nullable=False, default=0)
+    absent = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    def __repr__(self):
+        return f"<AttendanceSummary {self.student_matricule} - {self.course} - {self.term}>"
+
+# HELPER FUNCTIONS
+def term_for(when):
+    """Academic term of a datetime: years start in September, S1 runs Sep-Feb, S2 Mar-Aug."""
+    if when is None:
+        return 'unknown'
+    start_year = when.year if when.month >= 9 else when.year - 1
+    semester = 2 if 3 <= when.month <= 8 else 1
+    return f"{start_year}/{start_year + 1}-S{semester}"
+
+
+def _dialect_insert():
+    """Return the dialect's INSERT construct when it supports ON CONFLICT, else None."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    return None
+
+
+def summarize_attendance(rows):
+    """Count (student_matricule, course, date_time, final_status) rows per summary key."""
+    counts = {}
+    for matricule, course, when, status in rows:
+        key = (matricule, course, term_for(when))
+        entry = counts.setdefault(key, [0, 0, 0])
+        if status == 'present':
+            entry[0] += 1
+        elif status == 'absent':
+            entry[1] += 1
+        entry[2] += 1
+    return counts
+
+
+def apply_summary_counts(counts, sign=1):
+    """Add (or with ``sign=-1`` subtract) summarized counts to AttendanceSummary."""
+    if not counts:
+        return
+    values = [{
+        'student_matricule': matricule, 'course': course, 'term': term,
+        'present': sign * present, 'absent': sign * absent, 'total': sign * total
+    } for (matricule, course, term), (present, absent, total) in counts.items()]
+
+    insert = _dialect_insert()
+    if insert is not None:
+        stmt = insert(AttendanceSummary)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['student_matricule', 'course', 'term'],
+            set_={
+                'present': AttendanceSummary.present + stmt.excluded.present,
+                'absent': AttendanceSummary.absent + stmt.excluded.absent,
+                'total': AttendanceSummary.total + stmt.excluded.total,
+            }
+        )
+        db.session.execute(stmt, values)
+        return
+
+    for value in values:
+        summary = db.session.get(AttendanceSummary, (value['student_matricule'], value['course'], value['term']))
+        if summary is None:
+            db.session.add(AttendanceSummary(**value))
+        else:
+            summary.present += value['present']
+            summary.absent += value['absent']
+            summary.total += value['total']
+
+
+def forget_attendance(filter_clause):
+    """Subtract the attendance rows matching ``filter_clause`` from the summary.
+
+    Call before deleting those rows, in the same transaction.
+    """
+    rows = db.session.query(
+        Attendance.student_matricule, Attendance.course, Attendance.date_time, Attendance.final_status
+    ).filter(filter_clause)
+    apply_summary_counts(summarize_attendance(rows), sign=-1)
+
+
+def rebuild_attendance_summary(connection=None, chunk_size=5000):
+    """Recompute AttendanceSummary from the full Attendance table.
+
+    Streams the attendance rows in chunks, so memory grows with the number
+    of student/course/term combinations rather than the number of rows.
+    Returns the number of summary rows written.
+    """
+    executor = connection if connection is not None else db.session
+    query = db.select(
+        Attendance.student_matricule, Attendance.course, Attendance.date_time, Attendance.final_status
+    ).execution_options(yield_per=chunk_size)
+    counts = summarize_attendance(executor.execute(query))
+
+    executor.execute(db.delete(AttendanceSummary))
+    values = [{
+        'student_matricule': matricule, 'course': course, 'term': term,
+        'present': present, 'absent': absent, 'total': total
+    } for (matricule, course, term), (present, absent, total) in counts.items()]
+    if values:
+        executor.execute(db.insert(AttendanceSummary), values)
+    return len(values)
+
+def insert_attendance(rows, batch_size=500):
+    """Insert attendance rows (dicts of column values) with multi-row INSERTs.
+
+    Rows that would duplicate an existing (student, course, session) record
+    are skipped by the database's unique index, and the rows that were
+    inserted are added to AttendanceSummary. Rows are sent ``batch_size`` at
+    a time to stay under the driver's bound-parameter limit. Returns the
+    number of rows actually inserted.
+    """
+    if not rows:
+        return 0
+    insert = _dialect_insert()
+    columns = (Attendance.student_matricule, Attendance.course, Attendance.date_time, Attendance.final_status)
+
+    written = 0
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        if insert is not None:
+            # RETURNING only yields the rows that were actually inserted
+            stmt = insert(Attendance).values(batch).on_conflict_do_nothing().returning(*columns)
+            inserted = db.session.execute(stmt).all()
+        else:
+            keys = {(row['student_matricule'], row['course'], row['date_time']) for row in batch}
+            existing = set(db.session.query(Attendance.student_matricule, Attendance.course, Attendance.date_time)
+                           .filter(db.tuple_(Attendance.student_matricule, Attendance.course,
+                                             Attendance.date_time).in_(keys)))
+            stmt = db.insert(Attendance).values(batch).prefix_with('IGNORE', dialect='mysql')
+            db.session.execute(stmt)
+            inserted = [(row['student_matricule'], row['course'], row['date_time'], row.get('final_status', 'absent'))
+                        for row in batch
+                        if (row['student_matricule'], row['course'], row['date_time']) not in existing]
+        # Keep the rollup in step, in the same transaction
+        apply_summary_counts(summarize_attendance(inserted))
+        written += len(inserted)
+    return written
+
+
+def promote_students(dry_run=False):
+    """Promotes students to the next level at the start of a new academic year.
+
+    Runs as a single ``UPDATE students SET level = level + 1 WHERE level < 4``
+    instead of loading every student. Returns ``{level: count}`` for the
+    students promoted (or, with ``dry_run=True``, that would be promoted).
+    """
+    counts = dict(db.session.query(Student.level, db.func.count(Student.matricule))
+                  .filter(Student.level < 4)  # Promote up to level 4 only
+                  .group_by(Student.level)
+                  .order_by(Student.level)
+                  .all())
+    if dry_run:
+        return counts
+
+    db.session.execute(
+        db.update(Student).where(Student.level < 4).values(level=Student.level + 1),
+        execution_options={'synchronize_session': False}
+    )
     db.session.commit()
-    print("✅ All students promoted to next level (where applicable).")
\ No newline at end of file
+    print("✅ All students promoted to next level (where applicable).")
+    return counts
\ No newline at end of file
@@ -0,0 +1,43 @@
+from database_models.models import Student, Attendance
+from database_models.cache import get_cache
+
+
+def level_roster(level):
+    """Students of ``level`` as plain dicts, ordered by matricule.
+
+    Cached until a student write invalidates it (see invalidate_students).
+    """
+    def load():
+        rows = Student.query.with_entities(
+            Student.matricule, Student.name, Student.level, Student.role, Student.picture
+        ).filter_by(level=level).order_by(Student.matricule).all()
+        return [{'matricule': matricule, 'name': name, 'level': level, 'role': role, 'picture': picture}
+                for matricule, name, level, role, picture in rows]
+
+    return get_cache().get_or_set('roster', level, load)
+
+
+def admin_counts():
+    """Totals shown on the admin dashboard."""
+    def load():
+        return {
+            'total_students': Student.query.count(),
+            'total_attendance': Attendance.query.count(),
+            'delegates': Student.query.filter_by(role='delegate').count(),
+        }
+
+    return get_cache().get_or_set('admin_counts', 'totals', load)
+
+
+def invalidate_students():
+    """Call after adding, editing, deleting or promoting students."""
+    cache = get_cache()
+    cache.invalidate('roster')
+    cache.invalidate('admin_counts')
+
+
+def invalidate_attendance():
+    """Call after deleting attendance records."""
+    cache = get_cache()
+    cache.invalidate('admin_counts')
+    cache.invalidate('attendance_count')
@@ -0,0 +1,47 @@
+from contextlib import contextmanager
+import os
+import sqlite3
+import threading
+
+
+class SqliteStore:
+    """Base for small stores kept in a WAL-mode SQLite file shared by every worker on the host.
+
+    Connections are opened per thread. ``_transaction`` runs its block in a
+    ``BEGIN IMMEDIATE`` transaction, so concurrent writers queue on the
+    database lock (up to ``TIMEOUT`` seconds) instead of overwriting each
+    other, while WAL lets readers carry on during a write. ``SCHEMA``
+    statements are run once when the store is opened.
+    """
+
+    SCHEMA = ()
+    TIMEOUT = 30
+    SYNCHRONOUS = 'NORMAL'
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._local = threading.local()
+        with self._transaction() as conn:
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.TIMEOUT, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(f'PRAGMA synchronous={self.SYNCHRONOUS}')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
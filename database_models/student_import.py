@@ -0,0 +1,218 @@
+from flask import current_app
+from database_models.models import Student
+from database_models.extensions import db
+from qr_face.pictures import store_picture, stored_picture
+import csv
+import io
+import itertools
+import os
+
+IMPORT_FIELDS = ('matricule', 'name', 'level', 'email', 'phone', 'specialty', 'role', 'picture')
+REQUIRED_FIELDS = ('matricule', 'name', 'level', 'email')
+ROLES = ('student', 'delegate')
+LEVELS = range(1, 5)
+# Errors kept in the report; the count covers all of them
+MAX_REPORTED_ERRORS = 500
+# What a reader raises on a corrupt or wrongly encoded file (UnicodeDecodeError is a ValueError)
+READ_ERRORS = (ValueError, csv.Error)
+
+
+def read_csv_rows(stream):
+    """Yield ``(line number, row dict)`` from a binary CSV stream, one row at a time."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(text)
+    for row in reader:
+        yield reader.line_num, {key.strip().lower(): value for key, value in row.items() if key}
+
+
+def read_xlsx_rows(stream):
+    """Yield ``(row number, row dict)`` from the first sheet of an XLSX file.
+
+    The workbook is opened read-only, so rows are streamed from the file
+    instead of being loaded into memory all at once.
+    """
+    from openpyxl import load_workbook
+    try:
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+    except Exception:
+        raise ValueError("The file is not a valid .xlsx workbook")
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [str(cell).strip().lower() if cell is not None else '' for cell in next(rows, ())]
+        for number, values in enumerate(rows, start=2):
+            if not any(value is not None and str(value).strip() for value in values):
+                continue
+            yield number, {key: value for key, value in zip(header, values) if key}
+    finally:
+        workbook.close()
+
+
+def read_rows(stream, filename):
+    """Pick the reader from the file extension (.csv or .xlsx); raises ValueError.
+
+    The first row is read straight away, so a file that can't be opened or
+    decoded at all is refused here, before anything is imported.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.csv':
+        rows = read_csv_rows(stream)
+    elif extension == '.xlsx':
+        rows = read_xlsx_rows(stream)
+    else:
+        raise ValueError(f"Unsupported file type {extension or filename!r}; use .csv or .xlsx")
+    try:
+        first = next(rows, None)
+    except READ_ERRORS as e:
+        raise ValueError(f"Could not read {filename}: {e}")
+    return itertools.chain([first], rows) if first is not None else iter(())
+
+
+def clean_row(row):
+    """Validate one input row and return the Student column values; raises ValueError."""
+    values = {field: str(row.get(field) or '').strip() for field in IMPORT_FIELDS}
+    missing = [field for field in REQUIRED_FIELDS if not values[field]]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    try:
+        values['level'] = int(float(values['level']))
+    except ValueError:
+        raise ValueError(f"level {values['level']!r} is not a number")
+    if values['level'] not in LEVELS:
+        raise ValueError(f"level must be between {LEVELS[0]} and {LEVELS[-1]}")
+    values['role'] = values['role'].lower() or 'student'
+    if values['role'] not in ROLES:
+        raise ValueError(f"role must be one of {', '.join(ROLES)}")
+    if '@' not in values['email']:
+        raise ValueError(f"email {values['email']!r} is not valid")
+    return values
+
+
+class StudentImport:
+    """Bulk-insert students from parsed rows, one chunk per transaction.
+
+    Each chunk is validated, then checked against the database with a single
+    query for matricules and emails that already exist; the remaining rows go
+    in with one executemany INSERT and one commit. Bad rows are collected in
+    ``errors`` as ``(line, message)`` and skipped, the rest of the file still
+    goes in. With ``photos`` (an open ZipFile), a picture is attached to each
+    student from the file named in its ``picture`` column, or else the file
+    named after its matricule. Without it, the ``picture`` column is only kept
+    when it is the path of an already stored picture.
+    """
+
+    def __init__(self, photos=None, chunk_size=None):
+        self.photos = photos
+        self.chunk_size = chunk_size or current_app.config.get('STUDENT_IMPORT_CHUNK_SIZE', 2000)
+        self.imported = []
+        self.errors = []
+        self.error_count = 0
+        # Keys seen earlier in the file, for duplicates that span chunks
+        self._matricules = set()
+        self._emails = set()
+        self._photo_names = {}
+        if photos is not None:
+            for name in photos.namelist():
+                if not name.endswith('/'):
+                    base = os.path.basename(name)
+                    self._photo_names.setdefault(base.lower(), name)
+                    self._photo_names.setdefault(os.path.splitext(base)[0].lower(), name)
+
+    def error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    def run(self, rows):
+        """Import every ``(line, row)`` pair; returns self for chaining.
+
+        If the file turns out to be unreadable part way (a bad byte in a
+        CSV, say), the rows before it are kept and the rest is reported as
+        one error.
+        """
+        chunk = []
+        rows = iter(rows)
+        line = 0
+        while True:
+            try:
+                line, row = next(rows)
+            except StopIteration:
+                break
+            except READ_ERRORS as e:
+                self.error(line + 1, f"file unreadable from here on, rest not imported: {e}")
+                break
+            try:
+                chunk.append((line, clean_row(row)))
+            except ValueError as e:
+                self.error(line, str(e))
+                continue
+            if len(chunk) >= self.chunk_size:
+                self._insert(chunk)
+                chunk = []
+        if chunk:
+            self._insert(chunk)
+        self.errors.sort()
+        return self
+
+    def _insert(self, chunk):
+        matricules = {values['matricule'] for _, values in chunk}
+        emails = {values['email'] for _, values in chunk}
+        existing = db.session.query(Student.matricule, Student.email).filter(
+            db.or_(Student.matricule.in_(matricules), Student.email.in_(emails))
+        ).all()
+        taken_matricules = self._matricules | {matricule for matricule, _ in existing}
+        taken_emails = self._emails | {email for _, email in existing}
+
+        accepted = []
+        for line, values in chunk:
+            if values['matricule'] in taken_matricules:
+                self.error(line, f"matricule {values['matricule']} already exists")
+            elif values['email'] in taken_emails:
+                self.error(line, f"email {values['email']} already exists")
+            else:
+                taken_matricules.add(values['matricule'])
+                taken_emails.add(values['email'])
+                values['picture'] = self._save_photo(line, values)
+                accepted.append((line, values))
+
+        if accepted:
+            try:
+                db.session.execute(db.insert(Student), [values for _, values in accepted])
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                for line, _ in accepted:
+                    self.error(line, f"not inserted: {e.__class__.__name__}")
+                return
+        self._matricules.update(values['matricule'] for _, values in accepted)
+        self._emails.update(values['email'] for _, values in accepted)
+        self.imported.extend((values['matricule'], values['picture']) for _, values in accepted)
+
+    def _save_photo(self, line, values):
+        """Store the student's photo from the zip (see store_picture); returns the picture path."""
+        if self.photos is None:
+            # Without a zip the column may only name a picture that is already stored
+            if not values['picture']:
+                return None
+            picture = stored_picture(values['picture'])
+            if picture is None:
+                self.error(line, f"picture {values['picture']} is not a stored picture; imported without it")
+            return picture
+        key = (values['picture'] or values['matricule']).lower()
+        name = self._photo_names.get(key) or self._photo_names.get(os.path.basename(key))
+        if name is None:
+            if values['picture']:
+                self.error(line, f"photo {values['picture']} not found in the zip; imported without it")
+            return None
+        with self.photos.open(name) as source:
+            try:
+                return store_picture(source)
+            except ValueError:
+                self.error(line, f"photo {name} is not an image; imported without it")
+                return None
+
+    def report(self):
+        return {
+            'imported': len(self.imported),
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
@@ -1,8 +1,36 @@
-from flask import Blueprint, render_template, redirect, url_for
+from flask import Blueprint, render_template, redirect, url_for, send_file, current_app, abort
 from flask_login import login_required, current_user
+from qr_face.pictures import VARIANTS, DIGEST_RE, picture_digest, ensure_variant
 
 main = Blueprint('main', __name__)
 
+
+@main.app_template_global()
+def picture_url(picture, variant='thumb'):
+    """URL of a student picture variant; pictures saved before hashing are served as-is."""
+    digest = picture_digest(picture)
+    if digest is None:
+        return url_for('static', filename=picture)
+    return url_for('main.student_picture', digest=digest, variant=variant)
+
+
+@main.route('/pictures/<digest>/<variant>.jpg')
+@login_required
+def student_picture(digest, variant):
+    if variant not in VARIANTS or not DIGEST_RE.match(digest):
+        abort(404)
+    # Normally rendered in the background after upload; rendered here if not yet
+    path = ensure_variant(digest, variant)
+    if path is None:
+        abort(404)
+    # The URL changes whenever the picture does, so browsers may keep it for good
+    response = send_file(path, mimetype='image/jpeg', etag=f"{digest}-{variant}",
+                         max_age=current_app.config.get('PICTURE_CACHE_MAX_AGE', 365 * 24 * 3600))
+    response.cache_control.private = True
+    response.cache_control.public = False
+    response.cache_control.immutable = True
+    return response
+
 @main.route('/dashboard')
 @login_required
 def dashboard():
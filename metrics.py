@@ -0,0 +1,205 @@
+from flask import current_app, g, request, has_request_context, Response
+from sqlalchemy import event
+from database_models.extensions import db
+import bisect
+import hmac
+import threading
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        running = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            running += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            yield f"{name}_bucket{_labels(dict(labels, le=le))} {running}"
+        yield f"{name}_sum{_labels(labels)} {self.total}"
+        yield f"{name}_count{_labels(labels)} {self.count}"
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for key, value in labels.items())
+    return '{' + ','.join(escaped) + '}'
+
+
+class RequestMetrics:
+    """Per-endpoint request latency, status counts and SQL statement counts/time (per process)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = {}
+        self.queries = {}
+        self.statuses = {}
+        self.sql_statements = {}
+        self.sql_seconds = {}
+        self.over_budget = {}
+
+    def record(self, endpoint, method, status, seconds, query_count, query_seconds, over_budget):
+        key = (endpoint, method)
+        with self._lock:
+            self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.queries.setdefault(key, Histogram(QUERY_COUNT_BUCKETS)).observe(query_count)
+            status_key = (endpoint, method, status)
+            self.statuses[status_key] = self.statuses.get(status_key, 0) + 1
+            self.sql_statements[key] = self.sql_statements.get(key, 0) + query_count
+            self.sql_seconds[key] = self.sql_seconds.get(key, 0.0) + query_seconds
+            if over_budget:
+                self.over_budget[key] = self.over_budget.get(key, 0) + 1
+
+    def lines(self):
+        with self._lock:
+            yield '# HELP http_request_duration_seconds Request latency by endpoint.'
+            yield '# TYPE http_request_duration_seconds histogram'
+            for (endpoint, method), histogram in sorted(self.latency.items()):
+                yield from histogram.lines('http_request_duration_seconds', {'endpoint': endpoint, 'method': method})
+            yield '# HELP http_requests_total Requests by endpoint and status code.'
+            yield '# TYPE http_requests_total counter'
+            for (endpoint, method, status), count in sorted(self.statuses.items()):
+                yield f"http_requests_total{_labels({'endpoint': endpoint, 'method': method, 'status': status})} {count}"
+            yield '# HELP db_queries_per_request SQL statements run per request.'
+            yield '# TYPE db_queries_per_request histogram'
+            for (endpoint, method), histogram in sorted(self.queries.items()):
+                yield from histogram.lines('db_queries_per_request', {'endpoint': endpoint, 'method': method})
+            yield '# HELP db_statements_total SQL statements run while serving requests.'
+            yield '# TYPE db_statements_total counter'
+            for (endpoint, method), count in sorted(self.sql_statements.items()):
+                yield f"db_statements_total{_labels({'endpoint': endpoint, 'method': method})} {count}"
+            yield '# HELP db_statement_seconds_total Time spent in SQL statements while serving requests.'
+            yield '# TYPE db_statement_seconds_total counter'
+            for (endpoint, method), seconds in sorted(self.sql_seconds.items()):
+                yield f"db_statement_seconds_total{_labels({'endpoint': endpoint, 'method': method})} {seconds}"
+            yield '# HELP db_query_budget_exceeded_total Requests that ran more SQL statements than QUERY_BUDGET.'
+            yield '# TYPE db_query_budget_exceeded_total counter'
+            for (endpoint, method), count in sorted(self.over_budget.items()):
+                yield f"db_query_budget_exceeded_total{_labels({'endpoint': endpoint, 'method': method})} {count}"
+
+
+def _component_lines(app):
+    """Counters kept by other parts of the app, if they have been created in this process."""
+    cache = app.extensions.get('cache')
+    if cache is not None:
+        stats = cache.stats()
+        yield '# TYPE cache_hits_total counter'
+        yield f"cache_hits_total {stats['hits']}"
+        yield '# TYPE cache_misses_total counter'
+        yield f"cache_misses_total {stats['misses']}"
+
+    limiter = app.extensions.get('rate_limiter')
+    if limiter is not None:
+        stats = limiter.stats()
+        yield '# TYPE rate_limit_allowed_total counter'
+        for endpoint, count in sorted(stats['allowed'].items()):
+            yield f"rate_limit_allowed_total{_labels({'endpoint': endpoint})} {count}"
+        yield '# TYPE rate_limit_limited_total counter'
+        for (endpoint, scope), count in sorted(stats['limited'].items()):
+            yield f"rate_limit_limited_total{_labels({'endpoint': endpoint, 'scope': scope})} {count}"
+
+    verifier = app.extensions.get('password_verifier')
+    if verifier is not None:
+        stats = verifier.stats()
+        yield '# TYPE password_hash_workers gauge'
+        yield f"password_hash_workers {stats['workers']}"
+        yield '# TYPE password_hash_pending gauge'
+        yield f"password_hash_pending {stats['pending']}"
+        yield '# TYPE password_hash_max_pending_seen gauge'
+        yield f"password_hash_max_pending_seen {stats['max_pending_seen']}"
+        yield '# TYPE password_hash_completed_total counter'
+        yield f"password_hash_completed_total {stats['completed']}"
+        yield '# TYPE password_hash_rejected_total counter'
+        yield f"password_hash_rejected_total {stats['rejected']}"
+        yield '# TYPE password_hash_seconds_total counter'
+        yield f"password_hash_seconds_total {stats['seconds']}"
+
+
+def _scrape_allowed():
+    """With METRICS_TOKEN set, require it as a bearer token; otherwise only local scrapers."""
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}")
+    return request.remote_addr in LOCAL_ADDRESSES
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # One value, not a stack: a failed statement never reaches the after hook,
+    # and the next statement on the connection simply overwrites it
+    conn.info['query_start'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('query_start', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    # Only statements run for a request are counted; CLI and background work are not
+    if has_request_context() and 'query_count' in g:
+        g.query_count += 1
+        g.query_seconds += elapsed
+
+
+def init_metrics(app):
+    """Instrument every request and SQL statement of ``app`` and serve /metrics.
+
+    Each request's latency, status and SQL statement count and time are
+    recorded per endpoint. Requests running more than QUERY_BUDGET statements
+    are logged and counted (the usual sign of an N+1 loop). With
+    QUERY_COUNT_HEADER set, responses carry an X-Query-Count header. Metrics
+    are per process; scrape every worker. /metrics is only served with
+    METRICS_ENABLED, and then only to METRICS_TOKEN holders or localhost.
+    """
+    metrics = app.extensions.setdefault('request_metrics', RequestMetrics())
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(db.engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+        g.query_count = 0
+        g.query_seconds = 0.0
+
+    @app.after_request
+    def record_request(response):
+        if 'request_start' not in g:
+            return response
+        elapsed = time.perf_counter() - g.request_start
+        budget = current_app.config.get('QUERY_BUDGET')
+        over_budget = budget is not None and g.query_count > budget
+        if over_budget:
+            current_app.logger.warning("%s %s ran %d SQL statements (budget %d)",
+                                       request.method, request.path, g.query_count, budget)
+        metrics.record(request.endpoint or 'unmatched', request.method, response.status_code,
+                       elapsed, g.query_count, g.query_seconds, over_budget)
+        if current_app.config.get('QUERY_COUNT_HEADER'):
+            response.headers['X-Query-Count'] = str(g.query_count)
+            response.headers['X-Query-Time'] = f"{g.query_seconds * 1000:.2f}ms"
+        return response
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        if not current_app.config.get('METRICS_ENABLED', False) or not _scrape_allowed():
+            return Response('Not Found', status=404)
+        lines = list(metrics.lines()) + list(_component_lines(current_app))
+        return Response('\n'.join(lines) + '\n', content_type=PROMETHEUS_MIMETYPE)
@@ -0,0 +1,128 @@
+from flask import current_app
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import sys
+import threading
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mock_face_recognition as face_recognition
+from database_models.models import Student
+from database_models.extensions import db
+from qr_face.face_index import FaceIndex, index_directory
+from qr_face.pictures import picture_digest, generate_variants, variant_path
+
+_executor = None
+_executor_lock = threading.Lock()
+# One lock per level, so two rebuilds of the same level never run at once
+_rebuild_locks = {}
+_rebuild_locks_lock = threading.Lock()
+
+
+def picture_file(picture):
+    """Absolute path of a ``Student.picture`` value (stored relative to static/)."""
+    return os.path.join(os.path.dirname(current_app.config['UPLOAD_FOLDER']), picture)
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def encoding_from_bytes(data):
+    return np.frombuffer(data, dtype=np.float32)
+
+
+def rebuild_level_index(level):
+    """Rebuild and save the face index of one level from the stored encodings.
+
+    Rebuilds of the same level are serialised, and each reads the encodings
+    inside the lock, so the last index saved is built from the latest data.
+    """
+    with _rebuild_locks_lock:
+        lock = _rebuild_locks.setdefault(level, threading.Lock())
+    with lock:
+        rows = db.session.query(Student.matricule, Student.face_encoding).filter(
+            Student.level == level, Student.face_encoding.isnot(None)
+        ).order_by(Student.matricule).all()
+        index = FaceIndex.build((matricule, encoding_from_bytes(data)) for matricule, data in rows)
+        index.save(index_directory(), level)
+    return index
+
+
+def enroll_student(matricule, rebuild_index=True):
+    """Compute and store the face encoding of a student's picture.
+
+    Nothing is recomputed when the picture's content hash matches the one
+    the stored encoding was computed from. Pictures from the image pipeline
+    also get their display variants rendered here, and are encoded from the
+    downscaled "medium" variant instead of the full-size upload. Returns True
+    if the encoding changed. Pass ``rebuild_index=False`` when enrolling many students and
+    rebuilding the indexes once at the end (see enroll_students).
+    """
+    student = db.session.get(Student, matricule)
+    if student is None or not student.picture:
+        return False
+    path = picture_file(student.picture)
+    if not os.path.exists(path):
+        return False
+
+    # Content-addressed pictures carry their hash in the file name
+    digest = picture_digest(student.picture)
+    if digest is not None:
+        generate_variants(student.picture)
+        path = variant_path(digest, 'medium')
+    else:
+        digest = file_hash(path)
+    if digest == student.picture_hash and student.face_encoding is not None:
+        return False
+
+    image = face_recognition.load_image_file(path)
+    encodings = face_recognition.face_encodings(image)
+    student.picture_hash = digest
+    student.face_encoding = np.asarray(encodings[0], dtype=np.float32).tobytes() if encodings else None
+    db.session.commit()
+
+    if rebuild_index:
+        rebuild_level_index(student.level)
+    return True
+
+
+def enroll_students(matricules):
+    """Enroll several students, rebuilding each affected level's index only once."""
+    levels = set()
+    for matricule in matricules:
+        if enroll_student(matricule, rebuild_index=False):
+            levels.add(db.session.query(Student.level).filter_by(matricule=matricule).scalar())
+    for level in levels:
+        rebuild_level_index(level)
+    return len(levels)
+
+
+def _run_in_app(app, func, *args):
+    with app.app_context():
+        try:
+            return func(*args)
+        except Exception:
+            db.session.rollback()
+            app.logger.exception("Face enrollment task %s%r failed", func.__name__, args)
+            raise
+
+
+def schedule(func, *args):
+    """Run ``func(*args)`` on the enrollment worker pool, inside an app context."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=current_app.config.get('ENROLLMENT_WORKERS', 2),
+                                           thread_name_prefix='enrollment')
+    return _executor.submit(_run_in_app, current_app._get_current_object(), func, *args)
+
+
+def schedule_enrollment(matricule):
+    """Queue encoding of a student's picture so the upload request returns immediately."""
+    return schedule(enroll_student, matricule)
@@ -0,0 +1,141 @@
+from flask import current_app
+from PIL import Image, ImageOps
+import hashlib
+import io
+import os
+import re
+import sys
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mock_face_recognition as face_recognition
+from qr_face.qr_render import write_atomic
+
+# Variant name -> size in pixels. "thumb" is a square crop for lists,
+# "medium" fits inside the box (and is what face encoding reads), "face" is
+# a square crop around the detected face.
+VARIANTS = {'thumb': 128, 'medium': 512, 'face': 256}
+EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif', 'WEBP': '.webp', 'BMP': '.bmp'}
+DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def _static_root():
+    return os.path.dirname(current_app.config['UPLOAD_FOLDER'])
+
+
+def picture_digest(picture):
+    """Content hash of a stored picture path, or None for pictures saved before hashing."""
+    if not picture:
+        return None
+    digest = os.path.splitext(os.path.basename(picture))[0]
+    return digest if DIGEST_RE.match(digest) else None
+
+
+def original_path(digest):
+    """Absolute path of the original stored under ``digest``, or None."""
+    directory = os.path.join(current_app.config['UPLOAD_FOLDER'], digest[:2])
+    for extension in EXTENSIONS.values():
+        path = os.path.join(directory, digest + extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def stored_picture(picture):
+    """``picture`` normalised to the path store_picture gave it, or None if it names no stored picture."""
+    digest = picture_digest(picture)
+    path = original_path(digest) if digest else None
+    if path is None:
+        return None
+    relative = os.path.relpath(path, _static_root())
+    return relative if os.path.normpath(picture) == relative else None
+
+
+def variant_path(digest, variant):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], 'variants', digest[:2], f"{digest}_{variant}.jpg")
+
+
+def store_picture(stream):
+    """Save an uploaded picture under its SHA-256 and return its path relative to static/.
+
+    The upload is hashed while it is copied to a temp file, so it is never
+    held in memory whole. Identical uploads map to the same file, and two
+    different pictures can never overwrite each other. Raises ValueError if
+    the data is not an image.
+    """
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    os.makedirs(upload_folder, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=upload_folder, suffix='.upload')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for block in iter(lambda: stream.read(1024 * 1024), b''):
+                digest.update(block)
+                f.write(block)
+        try:
+            with Image.open(tmp_path) as image:
+                image.verify()
+                extension = EXTENSIONS.get(image.format)
+        except Exception:
+            extension = None
+        if extension is None:
+            raise ValueError("The uploaded file is not a supported image")
+
+        digest = digest.hexdigest()
+        relative = os.path.join(os.path.basename(upload_folder), digest[:2], digest + extension)
+        target = os.path.join(_static_root(), relative)
+        if os.path.exists(target):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(tmp_path, target)
+        return relative
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def render_variant(source, variant):
+    """Render one variant of the image at ``source`` and return JPEG bytes."""
+    size = VARIANTS[variant]
+    with Image.open(source) as image:
+        # Let the JPEG decoder downscale while decoding when it can
+        image.draft('RGB', (VARIANTS['medium'], VARIANTS['medium']))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+    if variant == 'thumb':
+        image = ImageOps.fit(image, (size, size))
+    elif variant == 'medium':
+        image.thumbnail((size, size))
+    else:
+        image.thumbnail((VARIANTS['medium'], VARIANTS['medium']))
+        locations = face_recognition.face_locations(np.asarray(image))
+        if locations:
+            top, right, bottom, left = locations[0]
+            margin = (bottom - top) // 4
+            image = image.crop((max(left - margin, 0), max(top - margin, 0),
+                                min(right + margin, image.width), min(bottom + margin, image.height)))
+        image = ImageOps.fit(image, (size, size))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=85, optimize=True)
+    return buffer.getvalue()
+
+
+def ensure_variant(digest, variant):
+    """Return the path of a variant, rendering it first if needed (None if the original is gone)."""
+    path = variant_path(digest, variant)
+    if not os.path.exists(path):
+        source = original_path(digest)
+        if source is None:
+            return None
+        write_atomic(path, render_variant(source, variant))
+    return path
+
+
+def generate_variants(picture):
+    """Render every variant of a stored picture; meant to run on the enrollment pool."""
+    digest = picture_digest(picture)
+    if digest is None:
+        return []
+    return [ensure_variant(digest, variant) for variant in VARIANTS]
@@ -1,83 +1,172 @@
-from flask import Blueprint, jsonify, send_file
-import qrcode
+from flask import Blueprint, jsonify, send_file, current_app, request
+from flask_login import login_required, current_user
 import os
+import shutil
 import sys
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import mock_cv2 as cv2
 import mock_face_recognition as face_recognition
-from datetime import datetime, date
-import csv
+from qr_face.qr_batch import generate_batch
+from qr_face.verification import verify_frames, VerifierBusy
+from qr_face.face_index import get_face_index
+from qr_face.tokens import make_token
+from database_models.models import Student, Attendance, insert_attendance
+from database_models.extensions import db
+from database_models.rosters import level_roster
+from dashboards.live_session import get_store, new_session_id
+from dashboards.finalize import session_datetime, absent_students, finalize_session
+from datetime import datetime, date, timedelta
+import time
 
 qr_face = Blueprint('qr_face', __name__, url_prefix='/qr_face')
 
-# Student "DB" (simulate database)
-students = {
-    "S001": {"name": "Delegate", "picture_path": "delegate.jpg", "role": "Delegate"},
-    "S002": {"name": "Bob", "picture_path": "bob.jpg", "role": "Student"},
-    "S003": {"name": "Charlie", "picture_path": "charlie.jpg", "role": "Student"},
-    "S004": {"name": "Alice", "picture_path": "alice.jpg", "role": "Student"}
-}
-
-# Folders and attendance file
+# QR images folder, one subfolder per level and class (attendance itself lives in the attendance table)
 QR_FOLDER = "qrcodes"
 os.makedirs(QR_FOLDER, exist_ok=True)
-ATTENDANCE_FILE = "attendance.csv"
 
-# Create attendance file if it doesn't exist
-if not os.path.exists(ATTENDANCE_FILE):
-    with open(ATTENDANCE_FILE, mode="w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(["student_id", "name", "status", "timestamp"])
 
-# Store scan order (list of student_ids)
-scan_order = []
+def class_level():
+    """Level of the class: ``?level=``, else the logged-in user's own level."""
+    level = request.values.get("level", type=int)
+    if level is None and current_user.is_authenticated and current_user.matricule:
+        level = db.session.query(Student.level).filter_by(matricule=current_user.matricule).scalar()
+    return level
+
+
+def class_staff_error(level):
+    """403 response unless the user is an admin or the delegate of ``level``, else None."""
+    if current_user.role == "admin":
+        return None
+    if current_user.role == "delegate" and current_user.matricule and level == db.session.query(
+            Student.level).filter_by(matricule=current_user.matricule).scalar():
+        return None
+    return jsonify({"message": "Delegate or admin access required"}), 403
+
+
+def class_folder(level, class_id):
+    """Folder of one class's QR images, so classes of the same level never share files."""
+    return os.path.join(QR_FOLDER, str(level), class_id)
+
+
+def remove_ended_class_folders(level):
+    """Delete QR folders of this level whose class is no longer in the store (e.g. ended by finalize-sessions)."""
+    level_folder = os.path.join(QR_FOLDER, str(level))
+    if not os.path.isdir(level_folder):
+        return
+    store = get_store()
+    for entry in os.scandir(level_folder):
+        if entry.is_dir() and store.get(entry.name, include_students=False) is None:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def get_class(class_id):
+    """The class started by generate_qr, kept in the shared live-session store."""
+    return get_store().get(class_id) if class_id else None
+
+
+def class_course():
+    """Course the class is recorded under: ``?course=`` or QR_FACE_COURSE."""
+    return request.values.get("course") or current_app.config.get("QR_FACE_COURSE", "General")
+
+
+def day_bounds(day):
+    """``[start, end)`` datetimes of one calendar day, for range scans on date_time."""
+    start = datetime.combine(day, datetime.min.time())
+    return start, start + timedelta(days=1)
 
 
 @qr_face.route("/generate_qr", methods=["POST"])
+@login_required
 def generate_qr_for_all():
-    global scan_order
-    scan_order = []
+    """Start a class for one level and render a QR code for each of its students.
 
-    # Clear previous QR images
-    for file in os.listdir(QR_FOLDER):
-        os.remove(os.path.join(QR_FOLDER, file))
+    The class (roster and scan order) is stored in the live-session store,
+    so every worker sees it and several classes can run side by side; the
+    returned ``class_id`` identifies it in the other endpoints.
+    """
+    level = class_level()
+    if level is None:
+        return jsonify({"message": "level is required"}), 400
+    denied = class_staff_error(level)
+    if denied:
+        return denied
+    roster = level_roster(level)
+    remove_ended_class_folders(level)
+    class_id = new_session_id()
+    folder = class_folder(level, class_id)
+    os.makedirs(folder, exist_ok=True)
+    now = datetime.now()
+    qr_expiry = now + timedelta(minutes=30)
 
-    qr_list = []
-    for sid, data in students.items():
+    jobs = []
+    for data in roster:
         # Only students (exclude delegate) for QR generation
-        if data["role"] != "Student":
+        if data["role"] != "student":
             continue
 
-        qr_data = f"{sid}-QR"
-        filename = os.path.join(QR_FOLDER, f"{sid}.png")
-        img = qrcode.make(qr_data)
-        img.save(filename)
+        sid = data["matricule"]
+        jobs.append({
+            "student_id": sid,
+            "name": data["name"],
+            "qr_data": make_token(class_id, sid, qr_expiry),
+            "path": os.path.join(folder, f"{sid}.png")
+        })
 
-        qr_list.append({"student_id": sid, "name": data["name"], "qr_file": filename})
-        scan_order.append({"student_id": sid, "name": data["name"]})
+    # Render in parallel into this class's own folder; files are written atomically
+    manifest = generate_batch(jobs, workers=current_app.config.get('QR_BATCH_WORKERS'))
+    qr_list = [{"student_id": item["student_id"], "name": item["name"], "qr_file": item["path"]}
+               for item in manifest]
+
+    # Same fields as a delegate's live session, so finalize-sessions can end it too
+    delegate_id = next((data["matricule"] for data in roster if data["role"] == "delegate"), None)
+    class_data = {
+        "course": class_course(),
+        "date": now.strftime("%Y-%m-%d"),
+        "time": now.strftime("%H:%M"),
+        "lecture_description": "",
+        "start_time": now.strftime("%Y-%m-%d %H:%M:%S"),
+        "qr_expiry": qr_expiry.strftime("%Y-%m-%d %H:%M:%S"),
+        "level": level,
+        "delegate_matricule": delegate_id,
+        "scan_order": [job["student_id"] for job in jobs]
+    }
+    get_store().create(class_data, [{
+        "matricule": job["student_id"],
+        "name": job["name"],
+        "qr_scanned": False,
+        "face_verified": False,
+        "qr_data": job["qr_data"]
+    } for job in jobs], session_id=class_id)
 
     # Auto-mark delegate as present
-    delegate_id = None
-    for sid, data in students.items():
-        if data["role"] == "Delegate":
-            delegate_id = sid
-            with open(ATTENDANCE_FILE, mode="a", newline="") as f:
-                writer = csv.writer(f)
-                writer.writerow([sid, data["name"], "Present", datetime.now().strftime("%Y-%m-%d %H:%M:%S")])
-            break
+    if delegate_id:
+        insert_attendance([{
+            "student_matricule": delegate_id,
+            "course": class_data["course"],
+            "date_time": session_datetime(class_data),
+            "qr_scan_status": True,
+            "face_id_status": True,
+            "final_status": "present"
+        }])
+        db.session.commit()
 
     return jsonify({
         "message": "QR codes generated",
+        "class_id": class_id,
         "qr_list": qr_list,
         "delegate_marked_present": delegate_id,
-        "scan_order": scan_order
+        "scan_order": [{"student_id": job["student_id"], "name": job["name"]} for job in jobs]
     })
 
 
 @qr_face.route("/get_scan_order", methods=["GET"])
 def get_scan_order():
-    return jsonify(scan_order)
+    current_class = get_class(request.args.get("class_id"))
+    if current_class is None:
+        return jsonify({"message": "Unknown class"}), 404
+    return jsonify([{"student_id": sid, "name": current_class["students"][sid]["name"]}
+                    for sid in current_class["scan_order"]])
 
 
 # Comment out the face verification function for now
@@ -85,26 +174,62 @@ def get_scan_order():
 # def verify_face(student_id):
 #     # ... function code ...
 
+@qr_face.route("/verify_batch", methods=["POST"])
+@login_required
+def verify_batch():
+    """Verify several camera frames (multipart ``frames``) against a student's enrolled face."""
+    matricule = request.form.get("matricule") or current_user.matricule
+    if current_user.role == "student" and matricule != current_user.matricule:
+        return jsonify({"message": "Students can only verify themselves"}), 403
+
+    frames = request.files.getlist("frames")
+    if not frames:
+        return jsonify({"message": "No frames provided"}), 400
+    if len(frames) > current_app.config.get("FACE_VERIFY_MAX_FRAMES", 10):
+        return jsonify({"message": "Too many frames"}), 400
+
+    # Compared against the level's shared, memory-mapped index instead of loading the student row
+    level = db.session.query(Student.level).filter_by(matricule=matricule).scalar()
+    index = get_face_index(level) if level is not None else None
+    if index is None or matricule not in index:
+        return jsonify({"message": "Student has no enrolled face"}), 404
+
+    start = time.perf_counter()
+    try:
+        results = verify_frames([frame.stream for frame in frames], index, matricule,
+                                tolerance=current_app.config.get("FACE_VERIFY_TOLERANCE", 0.6))
+    except VerifierBusy:
+        response = jsonify({"message": "Verification is busy, please retry"})
+        response.headers["Retry-After"] = "2"
+        return response, 503
+
+    verified = any(result["verdict"] == "match" for result in results)
+
+    # Record the verification on the live session, if one was given
+    session_id = request.form.get("session_id")
+    if verified and session_id:
+        get_store().update_student(session_id, matricule, face_verified=True)
+
+    return jsonify({
+        "matricule": matricule,
+        "verified": verified,
+        "frames": results,
+        "total_ms": round((time.perf_counter() - start) * 1000, 2)
+    })
+
 @qr_face.route("/end_class", methods=["POST"])
+@login_required
 def end_class():
-    today = date.today().strftime("%Y-%m-%d")
-
-    # Collect students already marked Present today
-    marked_present = set()
-    with open(ATTENDANCE_FILE, mode="r") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if row["status"] == "Present" and row["timestamp"].startswith(today):
-                marked_present.add(row["student_id"])
-
-    # Mark absent for remaining students
-    absents = []
-    with open(ATTENDANCE_FILE, mode="a", newline="") as f:
-        writer = csv.writer(f)
-        for sid, student in students.items():
-            if student["role"] == "Student" and sid not in marked_present:
-                writer.writerow([sid, student["name"], "Absent", datetime.now().strftime("%Y-%m-%d %H:%M:%S")])
-                absents.append(student["name"])
+    current_class = get_class(request.values.get("class_id"))
+    if current_class is None:
+        return jsonify({"message": "Unknown class"}), 404
+    denied = class_staff_error(current_class["level"])
+    if denied:
+        return denied
+    # Same end-of-class rule as finalize-sessions: whoever hasn't completed both checks is absent
+    absents = [student["name"] for student in absent_students(current_class)]
+    finalize_session(current_class)
+    shutil.rmtree(class_folder(current_class["level"], current_class["id"]), ignore_errors=True)
 
     return jsonify({
         "message": "Class ended",
@@ -113,10 +238,27 @@ def end_class():
 
 
 @qr_face.route("/attendance", methods=["GET"])
+@login_required
 def get_attendance():
-    records = []
-    with open(ATTENDANCE_FILE, mode="r") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            records.append(row)
+    """Attendance of one day (``?date=YYYY-MM-DD``, default today), optionally one ``?course=``."""
+    try:
+        day = datetime.strptime(request.args["date"], "%Y-%m-%d").date() if request.args.get("date") else date.today()
+    except ValueError:
+        return jsonify({"error": "date must be YYYY-MM-DD"}), 400
+    start, end = day_bounds(day)
+
+    query = db.session.query(
+        Attendance.student_matricule, Student.name, Attendance.final_status, Attendance.date_time
+    ).outerjoin(Student, Student.matricule == Attendance.student_matricule).filter(
+        Attendance.date_time >= start, Attendance.date_time < end
+    )
+    if request.args.get("course"):
+        query = query.filter(Attendance.course == request.args["course"])
+
+    records = [{
+        "student_id": sid,
+        "name": name,
+        "status": status.capitalize(),
+        "timestamp": when.strftime("%Y-%m-%d %H:%M:%S")
+    } for sid, name, status, when in query.order_by(Attendance.date_time, Attendance.id)]
     return jsonify(records)
\ No newline at end of file
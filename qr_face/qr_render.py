@@ -0,0 +1,92 @@
+from flask import current_app
+from collections import OrderedDict
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import qrcode
+
+
+def render_qr_png(qr_data):
+    """Render ``qr_data`` as a QR code and return the PNG bytes."""
+    buffer = io.BytesIO()
+    qrcode.make(qr_data).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def qr_key(qr_data):
+    """Stable cache key (and ETag) for a QR payload."""
+    return hashlib.sha256(qr_data.encode('utf-8')).hexdigest()
+
+
+def write_atomic(path, data):
+    """Write ``data`` to ``path`` so readers never see a partial file."""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class QRCache:
+    """Bounded LRU cache of rendered QR PNGs keyed by their payload.
+
+    Entries live in memory up to ``max_entries``; when ``disk_dir`` is set,
+    rendered codes are also kept on disk so they survive eviction and can be
+    shared by several worker processes.
+    """
+
+    def __init__(self, max_entries=1024, disk_dir=None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.png")
+
+    def get(self, qr_data):
+        """Return ``(png_bytes, key)`` for ``qr_data``, rendering it if needed."""
+        key = qr_key(qr_data)
+        with self._lock:
+            png = self._entries.get(key)
+            if png is not None:
+                self._entries.move_to_end(key)
+                return png, key
+
+        png = None
+        if self.disk_dir:
+            try:
+                with open(self.disk_path(key), 'rb') as f:
+                    png = f.read()
+            except OSError:
+                png = None
+        if png is None:
+            png = render_qr_png(qr_data)
+            if self.disk_dir:
+                write_atomic(self.disk_path(key), png)
+
+        with self._lock:
+            self._entries[key] = png
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return png, key
+
+
+def get_qr_cache():
+    """Return the QR cache configured for the current app."""
+    cache = current_app.extensions.get('qr_cache')
+    if cache is None:
+        cache = current_app.extensions.setdefault('qr_cache', QRCache(
+            max_entries=current_app.config.get('QR_CACHE_SIZE', 1024),
+            disk_dir=current_app.config.get('QR_CACHE_DIR')
+        ))
+    return cache
@@ -0,0 +1,109 @@
+from flask import current_app
+import base64
+import hashlib
+import heapq
+import hmac
+import threading
+import time
+
+# Bytes of HMAC-SHA256 kept in a token; 16 bytes is plenty against forgery
+# and keeps the QR code small.
+SIGNATURE_SIZE = 16
+
+
+class InvalidToken(ValueError):
+    """The scanned QR payload is malformed, forged or expired."""
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _signature(payload, secret):
+    # Derive a key of our own so a QR signature can't be replayed as any other signed value
+    key = hmac.new(secret.encode('utf-8'), b'qr-token', hashlib.sha256).digest()
+    return hmac.new(key, payload, hashlib.sha256).digest()[:SIGNATURE_SIZE]
+
+
+def make_token(session_id, matricule, expires_at, secret=None):
+    """Return the signed QR payload for one student of one live session.
+
+    ``expires_at`` is a datetime. The token carries the session id, the
+    matricule and the expiry, so checking it needs no server-side lookup.
+    """
+    secret = secret or current_app.config['SECRET_KEY']
+    payload = f"{session_id}:{int(expires_at.timestamp())}:{matricule}".encode('utf-8')
+    return f"{_b64encode(payload)}.{_b64encode(_signature(payload, secret))}"
+
+
+def read_token(token, secret=None, now=None):
+    """Check a token and return ``(session_id, matricule, expires_at, token_id)``.
+
+    ``expires_at`` is a Unix timestamp and ``token_id`` the token's signature,
+    a short unique key for replay tracking. Raises InvalidToken.
+    """
+    secret = secret or current_app.config['SECRET_KEY']
+    try:
+        encoded_payload, encoded_signature = token.split('.')
+        payload = _b64decode(encoded_payload)
+        signature = _b64decode(encoded_signature)
+    except (AttributeError, ValueError):
+        raise InvalidToken('Malformed QR code')
+    if not hmac.compare_digest(signature, _signature(payload, secret)):
+        raise InvalidToken('QR code signature is invalid')
+
+    session_id, expires_at, matricule = payload.decode('utf-8').split(':', 2)
+    expires_at = int(expires_at)
+    if (now if now is not None else time.time()) > expires_at:
+        raise InvalidToken('QR code scanning period has expired')
+    return session_id, matricule, expires_at, signature
+
+
+class SeenTokens:
+    """Signatures of tokens already accepted, each kept only until it expires.
+
+    Entries are 16-byte signatures plus an expiry, and expired ones are
+    dropped in expiry order from a heap, so memory stays bounded by the
+    tokens that could still be replayed.
+    """
+
+    def __init__(self):
+        self._expiry = {}
+        self._heap = []
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        while self._heap and self._heap[0][0] < now:
+            _, token_id = heapq.heappop(self._heap)
+            self._expiry.pop(token_id, None)
+
+    def add(self, token_id, expires_at, now=None):
+        """Record a token; returns False if it was already seen (a replay)."""
+        now = now if now is not None else time.time()
+        with self._lock:
+            self._prune(now)
+            if token_id in self._expiry:
+                return False
+            self._expiry[token_id] = expires_at
+            heapq.heappush(self._heap, (expires_at, token_id))
+            return True
+
+    def __contains__(self, token_id):
+        with self._lock:
+            self._prune(time.time())
+            return token_id in self._expiry
+
+    def __len__(self):
+        return len(self._expiry)
+
+
+def get_seen_tokens():
+    """Return the replay set of the current app."""
+    seen = current_app.extensions.get('qr_seen_tokens')
+    if seen is None:
+        seen = current_app.extensions.setdefault('qr_seen_tokens', SeenTokens())
+    return seen
@@ -0,0 +1,101 @@
+from flask import current_app
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+import os
+import sys
+import threading
+import time
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mock_face_recognition as face_recognition
+
+_pool = None
+_pool_slots = None
+_pool_lock = threading.Lock()
+
+
+class VerifierBusy(Exception):
+    """Raised when every encoding slot is taken; the client should retry later."""
+
+
+def _encode_faces(image, locations):
+    """Compute face encodings (runs in a worker process)."""
+    return [np.asarray(encoding, dtype=np.float32) for encoding in face_recognition.face_encodings(image, locations)]
+
+
+def _get_pool():
+    global _pool, _pool_slots
+    with _pool_lock:
+        if _pool is None:
+            workers = current_app.config.get('FACE_VERIFY_WORKERS') or os.cpu_count() or 1
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            # Bound the work queued behind the pool so a burst can't pile up unbounded
+            _pool_slots = threading.BoundedSemaphore(current_app.config.get('FACE_VERIFY_MAX_PENDING', workers * 4))
+        return _pool, _pool_slots
+
+
+def load_frame(stream, max_dim):
+    """Decode an uploaded frame and downscale it so its longest side is at most ``max_dim``."""
+    image = Image.open(stream)
+    image.draft('RGB', (max_dim, max_dim))  # cheap JPEG DCT scaling before the full decode
+    image = image.convert('RGB')
+    image.thumbnail((max_dim, max_dim))
+    return np.asarray(image)
+
+
+def verify_frames(frames, index, matricule, tolerance=0.6):
+    """Verify uploaded frames against a student's encoding in their level's FaceIndex.
+
+    Each frame is downscaled, then run through face detection; frames with
+    no face are rejected right there, before any encoding work. Encodings of
+    the remaining frames are computed in parallel on the bounded process pool.
+    Returns one result dict per frame, with a verdict and per-stage timings
+    in milliseconds. Raises VerifierBusy if no pool slot frees up in time.
+    """
+    max_dim = current_app.config.get('FACE_VERIFY_MAX_DIM', 320)
+    timeout = current_app.config.get('FACE_VERIFY_QUEUE_TIMEOUT', 2.0)
+    pool, slots = _get_pool()
+
+    results = []
+    pending = []
+    try:
+        for position, stream in enumerate(frames):
+            result = {'frame': position, 'timings': {}}
+            results.append(result)
+
+            start = time.perf_counter()
+            try:
+                image = load_frame(stream, max_dim)
+            except (OSError, ValueError):
+                result['verdict'] = 'invalid_image'
+                continue
+            result['timings']['decode'] = round((time.perf_counter() - start) * 1000, 2)
+
+            start = time.perf_counter()
+            locations = face_recognition.face_locations(image)
+            result['timings']['detect'] = round((time.perf_counter() - start) * 1000, 2)
+            if not locations:
+                result['verdict'] = 'no_face'
+                continue
+
+            if not slots.acquire(timeout=timeout):
+                raise VerifierBusy()
+            future = pool.submit(_encode_faces, image, locations[:1])
+            future.add_done_callback(lambda _: slots.release())
+            pending.append((result, future, time.perf_counter()))
+
+        for result, future, submitted in pending:
+            encodings = future.result()
+            result['timings']['encode'] = round((time.perf_counter() - submitted) * 1000, 2)
+            if not encodings:
+                result['verdict'] = 'no_face'
+                continue
+            distance = index.distance_to(matricule, encodings[0])
+            result['distance'] = round(distance, 4)
+            result['verdict'] = 'match' if distance <= tolerance else 'no_match'
+    except VerifierBusy:
+        for _, future, _ in pending:
+            future.cancel()
+        raise
+    return results
@@ -0,0 +1,53 @@
+from datetime import datetime
+from flask import Flask
+import pytest
+
+from database_models.extensions import db
+from database_models.migrations import upgrade_schema
+from database_models.models import Attendance, Student
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + str(tmp_path / 'indexes.db')
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        upgrade_schema()
+        yield app
+
+
+def query_plan(query):
+    """SQLite's EXPLAIN QUERY PLAN for a query, as one string."""
+    sql = query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+    rows = db.session.execute(db.text(f"EXPLAIN QUERY PLAN {sql}")).all()
+    return '\n'.join(row[-1] for row in rows)
+
+
+def test_session_lookup_uses_unique_index(app):
+    # The dedup lookup of finalize_session / end_session
+    plan = query_plan(db.session.query(Attendance.student_matricule).filter(
+        Attendance.course == 'Math',
+        Attendance.date_time == datetime(2024, 1, 8, 9, 0),
+        Attendance.student_matricule.in_(['S001', 'S002'])
+    ))
+    assert 'uq_attendance_student_course_session' in plan
+
+
+def test_level_join_uses_level_index(app):
+    # The dashboards' attendance-by-level join
+    plan = query_plan(db.session.query(Attendance, Student).join(
+        Student, Attendance.student_matricule == Student.matricule
+    ).filter(Student.level == 2))
+    assert 'ix_students_level' in plan
+    assert 'uq_attendance_student_course_session' in plan
+
+
+def test_date_ordering_uses_date_index(app):
+    # Date-range listing in (date_time, id) order, without a temp B-tree sort
+    plan = query_plan(db.session.query(Attendance).filter(
+        Attendance.date_time >= datetime(2024, 1, 8), Attendance.date_time < datetime(2024, 1, 9)
+    ).order_by(Attendance.date_time, Attendance.id))
+    assert 'ix_attendance_date_time_id' in plan
+    assert 'USE TEMP B-TREE' not in plan
@@ -0,0 +1,41 @@
+import multiprocessing
+
+from dashboards.live_session import SqliteLiveSessionStore
+
+WORKERS = 8
+STUDENTS = 200
+
+
+def race(path, session_id, worker, matricules):
+    """One worker process: tag every roster entry, and try to claim every scan."""
+    store = SqliteLiveSessionStore(path=path)
+    claimed = 0
+    for matricule in matricules:
+        store.update_student(session_id, matricule, **{f"seen_by_{worker}": True})
+        if store.update_student(session_id, matricule, expect={'qr_scanned': False}, qr_scanned=True, by=worker):
+            claimed += 1
+    return claimed
+
+
+def test_concurrent_updates_are_not_lost(tmp_path):
+    path = str(tmp_path / 'live_sessions.db')
+    store = SqliteLiveSessionStore(path=path)
+    matricules = [f"S{i:04d}" for i in range(STUDENTS)]
+    session_id = store.create({'level': 1}, [{'matricule': m, 'qr_scanned': False} for m in matricules])
+
+    # Spawned, not forked, so no worker inherits the parent's SQLite connection
+    with multiprocessing.get_context('spawn').Pool(WORKERS) as pool:
+        claimed = pool.starmap(race, [(path, session_id, worker, matricules[worker:] + matricules[:worker])
+                                      for worker in range(WORKERS)])
+
+    students = store.get(session_id)['students']
+    # Every worker's tag survived on every entry: no read-modify-write was overwritten
+    for entry in students.values():
+        assert all(entry.get(f"seen_by_{worker}") for worker in range(WORKERS))
+        assert entry['qr_scanned']
+    # Each conditional scan was won by exactly one worker
+    assert sum(claimed) == STUDENTS
+
+    # One event per successful update, numbered 1..n with no gaps or repeats
+    events = store.events_since(session_id, 0)
+    assert [seq for seq, _ in events] == list(range(1, WORKERS * STUDENTS + STUDENTS + 1))
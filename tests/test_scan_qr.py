@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+from flask import Flask
+import pytest
+
+from database_models.extensions import db, login_manager
+from database_models.models import Student, User
+from dashboards.live_session import get_store
+from dashboards.student import student as student_blueprint
+from qr_face.tokens import make_token
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config.update(
+        SECRET_KEY='test',
+        SQLALCHEMY_DATABASE_URI='sqlite:///' + str(tmp_path / 'scan.db'),
+        LIVE_SESSION_BACKEND='memory',
+        RATE_LIMIT_ENABLED=False,
+        TESTING=True,
+    )
+    db.init_app(app)
+    login_manager.init_app(app)
+    login_manager.user_loader(lambda user_id: db.session.get(User, int(user_id)))
+    app.register_blueprint(student_blueprint)
+    with app.app_context():
+        db.create_all()
+        db.session.add(Student(matricule='S001', name='Student One', level=1, email='s001@example.com'))
+        user = User(username='s001', matricule='S001', role='student', password_hash='-')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+    client = app.test_client()
+    with client.session_transaction() as cookie:
+        cookie['_user_id'] = str(user_id)
+    app.client = client
+    with app.app_context():
+        yield app
+
+
+def start_class(app):
+    session_id = get_store().create({'level': 1}, [{'matricule': 'S001', 'qr_scanned': False}])
+    return session_id, make_token(session_id, 'S001', datetime.now() + timedelta(minutes=30))
+
+
+def scan(app, token):
+    return app.client.post('/student/scan_qr', json={'qr_data': token}).get_json()
+
+
+def test_scan_is_recorded_once(app):
+    session_id, token = start_class(app)
+    assert scan(app, token)['success']
+    assert get_store().get_student(session_id, 'S001')['qr_scanned']
+    assert scan(app, token) == {'success': False, 'message': 'You have already scanned your QR code'}
+
+
+def test_retry_after_failed_store_write_is_accepted(app, monkeypatch):
+    session_id, token = start_class(app)
+    store = get_store()
+    update_student = store.update_student
+    calls = []
+
+    def fail_once(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise RuntimeError('database is locked')
+        return update_student(*args, **kwargs)
+
+    monkeypatch.setattr(store, 'update_student', fail_once)
+    with pytest.raises(RuntimeError):
+        scan(app, token)
+    # The failed write must not burn the token
+    assert scan(app, token)['success']
+    assert store.get_student(session_id, 'S001')['qr_scanned']